@@ -33,7 +33,7 @@ class DemoApp(IApplication):
 
     def consume_event(self, event: Event):
         if event.kind == EVENT_RESIZE:
-            self.image = TextImage(event.data)  # data is the new size
+            self.image.resize(event.data)  # data is the new size
         elif event.kind == EVENT_KEYBOARD and event.data.key == 'q':
             raise StopIteration
         self.repaint(event)
@@ -34,48 +34,79 @@ __all__ = [
     'BRIGHT_RED',
     'BRIGHT_WHITE',
     'BRIGHT_YELLOW',
+    'BUTTON_LEFT',
+    'BUTTON_MIDDLE',
+    'BUTTON_RIGHT',
     'CYAN',
     'Cell',
+    'DoubleBuffer',
     'DrawingContext',
     'EVENT_KEYBOARD',
     'EVENT_MOUSE',
     'EVENT_RESIZE',
     'Event',
     'GREEN',
+    'HitTestIndex',
     'IApplication',
     'IDisplay',
     'KeyboardData',
     'MAGENTA',
+    'MOUSE_MOTION',
+    'MOUSE_PRESS',
+    'MOUSE_RELEASE',
     'MouseData',
     'NORMAL',
     'RED',
     'REVERSE',
     'Rect',
+    'Region',
     'Size',
     'TestDisplay',
     'TextAttributes',
+    'TextBuffer',
     'TextImage',
+    'TextImageView',
+    'TextLayout',
+    'TiledTextImage',
     'UNDERLINE',
+    'WHEEL_DOWN',
+    'WHEEL_UP',
     'WHITE',
+    'WRAP_CHAR',
+    'WRAP_WORD',
     'YELLOW',
     '__version__',
     'get_display',
+    'printable_text',
+    'rgb',
 ]
 
 from .abc import IApplication
 from .abc import IDisplay
 from .bits import Cell
 from .bits import Rect
+from .bits import Region
 from .bits import Size
+from .buffer import DoubleBuffer
+from .color import rgb
 from .display import TestDisplay
 from .display import get_display
 from .drawing import DrawingContext
+from .events import BUTTON_LEFT
+from .events import BUTTON_MIDDLE
+from .events import BUTTON_RIGHT
 from .events import EVENT_KEYBOARD
 from .events import EVENT_MOUSE
 from .events import EVENT_RESIZE
 from .events import Event
 from .events import KeyboardData
+from .events import MOUSE_MOTION
+from .events import MOUSE_PRESS
+from .events import MOUSE_RELEASE
 from .events import MouseData
+from .events import WHEEL_DOWN
+from .events import WHEEL_UP
+from .hittest import HitTestIndex
 from .image import BLACK
 from .image import BLUE
 from .image import BRIGHT_BLACK
@@ -93,7 +124,14 @@ from .image import NORMAL
 from .image import RED
 from .image import REVERSE
 from .image import TextAttributes
+from .image import TextBuffer
 from .image import TextImage
+from .image import TextImageView
 from .image import UNDERLINE
 from .image import WHITE
 from .image import YELLOW
+from .image import printable_text
+from .layout import TextLayout
+from .layout import WRAP_CHAR
+from .layout import WRAP_WORD
+from .tiled import TiledTextImage
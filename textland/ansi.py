@@ -0,0 +1,440 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+ANSI (ECMA-48 / VT100) escape sequences for raw terminal output and a
+parser of the input of terminals in raw mode.
+
+Coordinates are zero-based, like everywhere else in textland.
+"""
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+from . import keys
+from .color import TRUECOLOR
+from .diff import Scroll
+from .events import BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT
+from .events import EVENT_KEYBOARD, EVENT_MOUSE
+from .events import Event, KeyboardData, MouseData
+from .events import MOUSE_MOTION, MOUSE_PRESS, MOUSE_RELEASE
+from .events import WHEEL_DOWN, WHEEL_UP
+from .events import coalesce_motion
+from .image import REVERSE
+from .image import TextAttributes
+from .image import UNDERLINE
+
+# Control sequence introducer
+CSI = '\x1b['
+
+# Sequences used to take over and give back the terminal
+ENTER_ALTERNATE_SCREEN = CSI + '?1049h'
+LEAVE_ALTERNATE_SCREEN = CSI + '?1049l'
+HIDE_CURSOR = CSI + '?25l'
+SHOW_CURSOR = CSI + '?25h'
+RESET_ATTRIBUTES = CSI + '0m'
+CLEAR_SCREEN = CSI + '2J'
+
+# Report mouse buttons and motion while a button is held down (1002), with
+# SGR encoded coordinates (1006)
+ENABLE_MOUSE = CSI + '?1002h' + CSI + '?1006h'
+DISABLE_MOUSE = CSI + '?1006l' + CSI + '?1002l'
+
+# Buttons in the mouse reports of terminals
+_MOUSE_BUTTONS = (BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT)
+
+
+def cursor_position(x: int, y: int) -> str:
+    """
+    Move the cursor to (*x*, *y*) (CUP)
+    """
+    return '{}{};{}H'.format(CSI, y + 1, x + 1)
+
+
+def cursor_up(lines: int) -> str:
+    """
+    Move the cursor up (CUU)
+    """
+    return CSI + 'A' if lines == 1 else '{}{}A'.format(CSI, lines)
+
+
+def cursor_down(lines: int) -> str:
+    """
+    Move the cursor down (CUD)
+    """
+    return CSI + 'B' if lines == 1 else '{}{}B'.format(CSI, lines)
+
+
+def cursor_forward(columns: int) -> str:
+    """
+    Move the cursor right (CUF)
+    """
+    return CSI + 'C' if columns == 1 else '{}{}C'.format(CSI, columns)
+
+
+def cursor_backward(columns: int) -> str:
+    """
+    Move the cursor left (CUB)
+    """
+    return CSI + 'D' if columns == 1 else '{}{}D'.format(CSI, columns)
+
+
+def cursor_column(x: int) -> str:
+    """
+    Move the cursor to column *x* of the current row (CHA)
+    """
+    return '{}{}G'.format(CSI, x + 1)
+
+
+def _color_params(color: int, base: int) -> str:
+    if color & TRUECOLOR:
+        return '{};2;{};{};{}'.format(
+            base + 8, (color >> 16) & 255, (color >> 8) & 255, color & 255)
+    elif color < 8:
+        return str(base + color)
+    elif color < 16:
+        return str(base + 60 + color - 8)  # aixterm bright colors
+    else:
+        return '{};5;{}'.format(base + 8, color)
+
+
+def select_attributes(pa: int, old_pa: int=None) -> str:
+    """
+    Switch to packed attributes *pa* (SGR)
+
+    :param pa:
+        The new packed attributes
+    :param old_pa:
+        The packed attributes currently in effect or None if not known.
+        Only the attributes that differ are changed.
+    :returns:
+        The shortest sequence found or an empty string if nothing changes
+    """
+    if pa == old_pa:
+        return ''
+    fg, bg, style = TextAttributes.unpack(pa)
+    if old_pa is None:
+        params = ['0']
+        old_fg = old_bg = None
+        old_style = 0
+    else:
+        params = []
+        old_fg, old_bg, old_style = TextAttributes.unpack(old_pa)
+    if old_style & UNDERLINE and not style & UNDERLINE:
+        params.append('24')
+    if old_style & REVERSE and not style & REVERSE:
+        params.append('27')
+    if style & UNDERLINE and not old_style & UNDERLINE:
+        params.append('4')
+    if style & REVERSE and not old_style & REVERSE:
+        params.append('7')
+    if fg != old_fg:
+        params.append(_color_params(fg, 30))
+    if bg != old_bg:
+        params.append(_color_params(bg, 40))
+    return '{}{}m'.format(CSI, ';'.join(params))
+
+
+def set_scroll_region(top: int, bottom: int) -> str:
+    """
+    Restrict scrolling to rows *top* to *bottom*, inclusive (DECSTBM)
+    """
+    return '{}{};{}r'.format(CSI, top + 1, bottom + 1)
+
+
+def reset_scroll_region() -> str:
+    """
+    Allow scrolling of the whole screen again (DECSTBM)
+    """
+    return CSI + 'r'
+
+
+def scroll_up(lines: int) -> str:
+    """
+    Scroll the content of the scroll region up (SU)
+    """
+    return '{}{}S'.format(CSI, lines)
+
+
+def scroll_down(lines: int) -> str:
+    """
+    Scroll the content of the scroll region down (SD)
+    """
+    return '{}{}T'.format(CSI, lines)
+
+
+def perform_scroll(scroll: Scroll) -> str:
+    """
+    Perform a scroll operation found by textland.diff.find_scroll()
+
+    The scroll region is reset afterwards. DECSTBM moves the cursor to the
+    home position so the cursor position is undefined afterwards.
+    """
+    if scroll.amount > 0:
+        shift = scroll_up(scroll.amount)
+    else:
+        shift = scroll_down(-scroll.amount)
+    return (set_scroll_region(scroll.top, scroll.bottom) + shift
+            + reset_scroll_region())
+
+
+def setup_sequences(mouse: bool=False) -> str:
+    """
+    Get the sequences that take over the screen of a terminal
+
+    :param mouse:
+        If True, mouse reporting is enabled as well
+    """
+    sequences = ENTER_ALTERNATE_SCREEN + HIDE_CURSOR
+    if mouse:
+        sequences += ENABLE_MOUSE
+    return sequences
+
+
+def teardown_sequences(mouse: bool=False) -> str:
+    """
+    Get the sequences that give back what setup_sequences() took over
+    """
+    sequences = RESET_ATTRIBUTES + SHOW_CURSOR + LEAVE_ALTERNATE_SCREEN
+    if mouse:
+        sequences = DISABLE_MOUSE + sequences
+    return sequences
+
+
+def enter_raw_mode(fd_in: int, fd_out: int) -> tuple:
+    """
+    Put a terminal in the mode the ANSI backends need
+
+    Input is neither echoed nor buffered by lines, and output is not
+    post-processed, so that line feeds only move the cursor down (see
+    OutputEncoder).
+
+    :returns:
+        The saved attributes of both descriptors, for leave_raw_mode()
+    """
+    saved_attrs = (termios.tcgetattr(fd_in), termios.tcgetattr(fd_out))
+    attrs = termios.tcgetattr(fd_in)
+    attrs[3] &= ~(termios.ECHO | termios.ICANON)  # lflag
+    attrs[6][termios.VMIN] = 1
+    attrs[6][termios.VTIME] = 0
+    termios.tcsetattr(fd_in, termios.TCSANOW, attrs)
+    attrs = termios.tcgetattr(fd_out)
+    attrs[1] &= ~termios.OPOST  # oflag
+    termios.tcsetattr(fd_out, termios.TCSANOW, attrs)
+    return saved_attrs
+
+
+def leave_raw_mode(fd_in: int, fd_out: int, saved_attrs: tuple,
+                   drain: bool=True) -> None:
+    """
+    Restore the attributes saved by enter_raw_mode()
+
+    :param drain:
+        If True, pending output is written first, otherwise the attributes
+        are changed right away
+    """
+    when = termios.TCSADRAIN if drain else termios.TCSANOW
+    termios.tcsetattr(fd_in, when, saved_attrs[0])
+    termios.tcsetattr(fd_out, when, saved_attrs[1])
+
+
+class InputParser:
+    """
+    Parser of the keyboard and mouse input of a terminal in raw mode
+
+    Data is fed in as it is read and events are produced as soon as complete
+    characters or escape sequences have been seen. An escape character that
+    is not followed by anything is only reported by flush().
+
+    Mouse reports are understood both in the SGR (1006) and in the legacy
+    encoding. Consecutive motion events within the same batch of input are
+    coalesced.
+    """
+
+    _sequences = {
+        '\x1b[A': keys.KEY_UP,
+        '\x1b[B': keys.KEY_DOWN,
+        '\x1b[C': keys.KEY_RIGHT,
+        '\x1b[D': keys.KEY_LEFT,
+        '\x1bOA': keys.KEY_UP,
+        '\x1bOB': keys.KEY_DOWN,
+        '\x1bOC': keys.KEY_RIGHT,
+        '\x1bOD': keys.KEY_LEFT,
+    }
+
+    _keys = {
+        ' ': keys.KEY_SPACE,
+        '\n': keys.KEY_ENTER,
+        '\r': keys.KEY_ENTER,
+    }
+
+    def __init__(self, sequences: dict=None):
+        """
+        Initialize a new parser
+
+        :param sequences:
+            Extra escape sequences to recognize, mapped to key names, for
+            example the keys of a TerminalCapabilities
+        """
+        if sequences:
+            self._sequences = dict(self._sequences)
+            self._sequences.update(
+                (sequence, key) for sequence, key in sequences.items()
+                if sequence.startswith('\x1b'))
+        self._pending = ''
+        self._partial = b''
+        # Buttons held down, as seen in the mouse reports
+        self._buttons = 0
+
+    @property
+    def has_pending_input(self) -> bool:
+        """
+        Check if some input is waiting for the rest of a sequence
+        """
+        return bool(self._pending or self._partial)
+
+    def feed(self, data: bytes) -> list:
+        """
+        Parse more input
+
+        :param data:
+            Bytes read from the terminal
+        :returns:
+            A list of events
+        """
+        data = self._partial + data
+        try:
+            text = data.decode('UTF-8')
+            self._partial = b''
+        except UnicodeDecodeError as exc:
+            if exc.reason != 'unexpected end of data':
+                # Not UTF-8, the best guess is Latin-1
+                text = data.decode('Latin-1')
+                self._partial = b''
+            else:
+                text = data[:exc.start].decode('UTF-8')
+                self._partial = data[exc.start:]
+        self._pending += text
+        return self._parse(final=False)
+
+    def flush(self) -> list:
+        """
+        Parse all remaining input, including incomplete escape sequences
+        """
+        return self._parse(final=True)
+
+    def _parse(self, final: bool) -> list:
+        events = []
+        text = self._pending
+        index = 0
+        while index < len(text):
+            if text[index] != '\x1b':
+                events.append(self._key_event(text[index]))
+                index += 1
+                continue
+            length = self._sequence_length(text, index)
+            if length is None:
+                if not final:
+                    break
+                length = len(text) - index
+            sequence = text[index:index + length]
+            index += length
+            event = self._sequence_event(sequence)
+            if event is not None:
+                events.append(event)
+        self._pending = text[index:]
+        return coalesce_motion(events)
+
+    @staticmethod
+    def _sequence_length(text: str, index: int) -> int:
+        """
+        Get the length of the escape sequence at *index* or None if the
+        sequence is not complete yet
+        """
+        if index + 1 >= len(text):
+            return None
+        second = text[index + 1]
+        if second == 'O':
+            return 3 if index + 2 < len(text) else None
+        if second != '[':
+            return 1  # Escape key followed by another key
+        if text.startswith('\x1b[M', index):
+            # Legacy mouse report, followed by three raw bytes
+            return 6 if index + 5 < len(text) else None
+        for end in range(index + 2, len(text)):
+            if '@' <= text[end] <= '~':
+                return end - index + 1
+        return None
+
+    def _sequence_event(self, sequence: str) -> Event:
+        """
+        Get the event of one escape sequence or None if it is not known
+        """
+        if sequence == '\x1b':
+            return self._key_event(sequence)
+        if sequence.startswith('\x1b[M') and len(sequence) == 6:
+            code, x, y = (ord(c) - 32 for c in sequence[3:])
+            return self._mouse_event(code, x - 1, y - 1, None)
+        if sequence.startswith('\x1b[<') and sequence[-1] in 'Mm':
+            try:
+                code, x, y = (int(part) for part in sequence[3:-1].split(';'))
+            except ValueError:
+                return None
+            return self._mouse_event(code, x - 1, y - 1, sequence[-1] == 'm')
+        try:
+            return Event(EVENT_KEYBOARD, KeyboardData(
+                self._sequences[sequence]))
+        except KeyError:
+            return None
+
+    def _mouse_event(self, code: int, x: int, y: int,
+                     release: bool) -> Event:
+        """
+        Get the event of a mouse report
+
+        :param code:
+            Button code, as sent by the terminal. Button number 3 means no
+            particular button, it is sent by legacy reports and by some
+            terminals in SGR release reports.
+        :param release:
+            True for SGR release reports, None for legacy reports, where
+            the button that was released is not known
+        """
+        number = code & 3
+        if code & 64:
+            # Wheels are only ever "pressed"
+            button = WHEEL_DOWN if number else WHEEL_UP
+            return Event(EVENT_MOUSE, MouseData(x, y, button, MOUSE_PRESS))
+        if code & 32:
+            return Event(EVENT_MOUSE, MouseData(
+                x, y, self._buttons, MOUSE_MOTION))
+        if number == 3 or release:
+            if number == 3:
+                button = self._buttons  # Whichever buttons were held
+            else:
+                button = _MOUSE_BUTTONS[number]
+            self._buttons &= ~button
+            return Event(EVENT_MOUSE, MouseData(x, y, button, MOUSE_RELEASE))
+        button = _MOUSE_BUTTONS[number]
+        self._buttons |= button
+        return Event(EVENT_MOUSE, MouseData(x, y, button, MOUSE_PRESS))
+
+    def _key_event(self, c: str) -> Event:
+        return Event(EVENT_KEYBOARD, KeyboardData(self._keys.get(c, c)))
@@ -16,10 +16,296 @@
 # You should have received a copy of the GNU General Public License
 # along with Textland.  If not, see <http://www.gnu.org/licenses/>.
 
+from bisect import bisect_right
 from collections import namedtuple
 
 # Various sizing structs
 Cell = namedtuple('Cell', ['char', 'attributes'])
 Size = namedtuple('Size', ['width', 'height'])
 Offset = namedtuple('Offset', ['x', 'y'])
-Rect = namedtuple('Rect', ['x1', 'y1', 'x2', 'y2'])
+
+
+class Rect(namedtuple('Rect', ['x1', 'y1', 'x2', 'y2'])):
+    """
+    Rectangle of cells from (x1, y1) to (x2, y2) (exclusive)
+
+    Rectangles without any cells (x2 <= x1 or y2 <= y1) are empty. All the
+    operations below treat empty rectangles alike, whatever their
+    coordinates, and never produce inverted rectangles.
+    """
+
+    __slots__ = ()
+
+    @property
+    def width(self) -> int:
+        return max(0, self.x2 - self.x1)
+
+    @property
+    def height(self) -> int:
+        return max(0, self.y2 - self.y1)
+
+    def is_empty(self) -> bool:
+        return self.x2 <= self.x1 or self.y2 <= self.y1
+
+    def normalized(self) -> 'Rect':
+        """
+        Get the same rectangle with inverted coordinates collapsed
+        """
+        return Rect(self.x1, self.y1,
+                    max(self.x1, self.x2), max(self.y1, self.y2))
+
+    def intersection(self, other: 'Rect') -> 'Rect':
+        """
+        Get the rectangle of cells inside both rectangles
+        """
+        x1 = max(self.x1, other.x1)
+        y1 = max(self.y1, other.y1)
+        return Rect(x1, y1, max(x1, min(self.x2, other.x2)),
+                    max(y1, min(self.y2, other.y2)))
+
+    def union(self, other: 'Rect') -> 'Rect':
+        """
+        Get the smallest rectangle containing both rectangles
+        """
+        if other.is_empty():
+            return self.normalized()
+        if self.is_empty():
+            return other
+        return Rect(min(self.x1, other.x1), min(self.y1, other.y1),
+                    max(self.x2, other.x2), max(self.y2, other.y2))
+
+    def merged(self, other: 'Rect') -> 'Rect':
+        """
+        Get the union of both rectangles if it is a rectangle, else None
+        """
+        if self.contains(other):
+            return self
+        if other.contains(self):
+            return other
+        if (self.x1 == other.x1 and self.x2 == other.x2
+                and (self.y2 == other.y1 or other.y2 == self.y1)):
+            return Rect(self.x1, min(self.y1, other.y1),
+                        self.x2, max(self.y2, other.y2))
+        if (self.y1 == other.y1 and self.y2 == other.y2
+                and (self.x2 == other.x1 or other.x2 == self.x1)):
+            return Rect(min(self.x1, other.x1), self.y1,
+                        max(self.x2, other.x2), self.y2)
+        return None
+
+    def contains(self, other: 'Rect') -> bool:
+        """
+        Check if all the cells of *other* are inside this rectangle
+        """
+        if other.is_empty():
+            return True
+        return (self.x1 <= other.x1 and self.y1 <= other.y1
+                and other.x2 <= self.x2 and other.y2 <= self.y2)
+
+    def contains_point(self, x: int, y: int) -> bool:
+        return self.x1 <= x < self.x2 and self.y1 <= y < self.y2
+
+    def translated(self, dx: int, dy: int) -> 'Rect':
+        return Rect(self.x1 + dx, self.y1 + dy, self.x2 + dx, self.y2 + dy)
+
+
+def _inside(spans: tuple, x: int) -> bool:
+    """
+    Check if *x* is inside of one of the spans (x1, x2, x1, x2, ...)
+    """
+    return bisect_right(spans, x) % 2 == 1
+
+
+def _combine_spans(a: tuple, b: tuple, keep) -> tuple:
+    """
+    Combine two sets of spans, keeping cells for which keep(in_a, in_b)
+    """
+    points = sorted(set(a).union(b))
+    result = []
+    for x1, x2 in zip(points, points[1:]):
+        if keep(_inside(a, x1), _inside(b, x1)):
+            if result and result[-1] == x1:
+                result[-1] = x2
+            else:
+                result.extend((x1, x2))
+    return tuple(result)
+
+
+def _union(in_a: bool, in_b: bool) -> bool:
+    return in_a or in_b
+
+
+def _intersection(in_a: bool, in_b: bool) -> bool:
+    return in_a and in_b
+
+
+def _difference(in_a: bool, in_b: bool) -> bool:
+    return in_a and not in_b
+
+
+class Region:
+    """
+    Set of cells, stored as banded rectangles
+
+    The region is a list of horizontal bands that don't overlap, sorted from
+    top to bottom. Each band covers rows y1 to y2 (exclusive) and has a
+    sorted tuple of spans (x1, x2, x1, x2, ...) that neither overlap nor
+    touch. Adjacent bands never have the same spans. This representation
+    is unique so regions with the same cells compare equal, and all the
+    operations work on whole spans instead of single cells.
+    """
+
+    __slots__ = ('bands',)
+
+    def __init__(self, rects=()):
+        """
+        Initialize a new region covering the cells of all *rects*
+        """
+        rects = [rect for rect in rects if not rect.is_empty()]
+        bands = []
+        if len(rects) == 1:
+            rect = rects[0]
+            bands.append((rect.y1, rect.y2, (rect.x1, rect.x2)))
+        elif rects:
+            ys = sorted({y for rect in rects for y in (rect.y1, rect.y2)})
+            for y1, y2 in zip(ys, ys[1:]):
+                spans = ()
+                for rect in rects:
+                    if rect.y1 <= y1 < rect.y2:
+                        spans = _combine_spans(
+                            spans, (rect.x1, rect.x2), _union)
+                _append_band(bands, y1, y2, spans)
+        self.bands = bands
+
+    @classmethod
+    def _from_bands(cls, bands: list) -> 'Region':
+        region = cls.__new__(cls)
+        region.bands = bands
+        return region
+
+    def __bool__(self) -> bool:
+        return bool(self.bands)
+
+    def __eq__(self, other: 'Region') -> bool:
+        if not isinstance(other, Region):
+            return NotImplemented
+        return self.bands == other.bands
+
+    def __repr__(self) -> str:
+        return "Region({!r})".format(self.rects())
+
+    def is_empty(self) -> bool:
+        return not self.bands
+
+    def rects(self) -> list:
+        """
+        Get the list of disjoint rectangles making up the region
+        """
+        return [Rect(spans[i], y1, spans[i + 1], y2)
+                for y1, y2, spans in self.bands
+                for i in range(0, len(spans), 2)]
+
+    def bounds(self) -> Rect:
+        """
+        Get the smallest rectangle containing the whole region
+        """
+        if not self.bands:
+            return Rect(0, 0, 0, 0)
+        return Rect(min(spans[0] for _, _, spans in self.bands),
+                    self.bands[0][0],
+                    max(spans[-1] for _, _, spans in self.bands),
+                    self.bands[-1][1])
+
+    def area(self) -> int:
+        """
+        Get the number of cells in the region
+        """
+        return sum((y2 - y1) * (sum(spans[1::2]) - sum(spans[0::2]))
+                   for y1, y2, spans in self.bands)
+
+    def contains_point(self, x: int, y: int) -> bool:
+        index = self._band_index(y)
+        return (index < len(self.bands) and self.bands[index][0] <= y
+                and _inside(self.bands[index][2], x))
+
+    def contains(self, rect: Rect) -> bool:
+        """
+        Check if all the cells of *rect* are inside the region
+        """
+        if rect.is_empty():
+            return True
+        y = rect.y1
+        index = self._band_index(y)
+        while y < rect.y2:
+            if index >= len(self.bands):
+                return False
+            y1, y2, spans = self.bands[index]
+            if y1 > y:
+                return False
+            # Both ends must be in the same span
+            i = bisect_right(spans, rect.x1)
+            if i % 2 == 0 or spans[i] < rect.x2:
+                return False
+            y = y2
+            index += 1
+        return True
+
+    def translated(self, dx: int, dy: int) -> 'Region':
+        return Region._from_bands([
+            (y1 + dy, y2 + dy, tuple(x + dx for x in spans))
+            for y1, y2, spans in self.bands])
+
+    def union(self, other: 'Region') -> 'Region':
+        if not other.bands:
+            return self
+        if not self.bands:
+            return other
+        return self._combine(other, _union)
+
+    def intersection(self, other: 'Region') -> 'Region':
+        if not self.bands or not other.bands:
+            return Region()
+        return self._combine(other, _intersection)
+
+    def subtract(self, other: 'Region') -> 'Region':
+        if not self.bands or not other.bands:
+            return self
+        return self._combine(other, _difference)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = subtract
+
+    def _band_index(self, y: int) -> int:
+        """
+        Get the index of the first band that ends below row *y*
+        """
+        return bisect_right([band[1] for band in self.bands], y)
+
+    def _combine(self, other: 'Region', keep) -> 'Region':
+        a = self.bands
+        b = other.bands
+        ys = sorted({y for band in a + b for y in band[:2]})
+        bands = []
+        i = j = 0
+        for y1, y2 in zip(ys, ys[1:]):
+            # Walk both lists of bands down, in step with the rows
+            while i < len(a) and a[i][1] <= y1:
+                i += 1
+            while j < len(b) and b[j][1] <= y1:
+                j += 1
+            spans_a = a[i][2] if i < len(a) and a[i][0] <= y1 else ()
+            spans_b = b[j][2] if j < len(b) and b[j][0] <= y1 else ()
+            _append_band(bands, y1, y2, _combine_spans(spans_a, spans_b, keep))
+        return Region._from_bands(bands)
+
+
+def _append_band(bands: list, y1: int, y2: int, spans: tuple) -> None:
+    """
+    Append a band, merging it with the previous one when possible
+    """
+    if not spans:
+        return
+    if bands and bands[-1][1] == y1 and bands[-1][2] == spans:
+        bands[-1] = (bands[-1][0], y2, spans)
+    else:
+        bands.append((y1, y2, spans))
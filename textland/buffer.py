@@ -0,0 +1,79 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+from .bits import Size
+from .image import TextImage
+
+
+class DoubleBuffer:
+    """
+    Pair of images for applications that repaint incrementally
+
+    The application paints into the back image, calls swap() and hands the
+    front image over to the display. The front image is never modified
+    until the next call to swap() so displays may keep looking at it.
+
+    Both images are resized in place, reusing their buffers, so repeated
+    resize events (for example while dragging the edge of a terminal
+    window) don't allocate new buffers unless the image grows.
+    """
+
+    def __init__(self, size: Size=Size(0, 0), keep_content: bool=False):
+        """
+        Initialize a new pair of images
+
+        :param size:
+            Initial size of both images
+        :param keep_content:
+            If True, resize() keeps the part of the content that still fits
+        """
+        self.front = TextImage(size)
+        self.back = TextImage(size)
+        self.keep_content = keep_content
+
+    @property
+    def size(self) -> Size:
+        return self.back.size
+
+    def resize(self, size: Size) -> TextImage:
+        """
+        Resize both images
+
+        :param size:
+            The new size
+        :returns:
+            The back image
+        """
+        if size != self.back.size:
+            self.back.resize(size, self.keep_content)
+            self.front.resize(size, self.keep_content)
+        return self.back
+
+    def swap(self) -> TextImage:
+        """
+        Swap the front and back images
+
+        :returns:
+            The new front image, that is, the image that was just painted
+
+        The new back image starts with a copy of the new front image so that
+        applications only need to repaint what has changed.
+        """
+        self.front, self.back = self.back, self.front
+        self.back.copy_from(self.front)
+        return self.front
@@ -0,0 +1,192 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recording of displayed frames as asciicast v2 files.
+
+The recording can be played back with asciinema. Each frame is written as
+an output event holding the ANSI output that turns the previous frame into
+it, as encoded by OutputEncoder. Size changes are written as resize events,
+followed by a complete frame.
+"""
+
+from os import getenv
+from queue import Full, Queue
+from time import monotonic, time
+import json
+import threading
+
+from .abc import IApplication
+from .abc import IDisplay
+from .display import AbstractDisplay
+from .encoder import OutputEncoder
+from .image import TextImage
+
+
+class CastRecorder(IDisplay):
+    """
+    Display that records the frames shown by another display
+
+    Frames are copied as they are shown and handed over to a writer thread,
+    through a bounded queue, which encodes and writes them. Recording never
+    waits for the writer: when the queue is full the frame is dropped and
+    counted in *frames_dropped*, the next frame that gets through is then
+    encoded relative to the last frame that was written.
+
+    If writing fails, the error is kept in *error* and the writer keeps
+    taking frames off the queue, counting them in *frames_lost*, so that
+    recording and stop() never block.
+    """
+
+    def __init__(self, display: AbstractDisplay, stream,
+                 max_pending: int=64):
+        """
+        Initialize a new recorder
+
+        :param display:
+            Display that is used to run the application
+        :param stream:
+            Text stream the asciicast is written to
+        :param max_pending:
+            Maximum number of frames waiting to be written
+        """
+        self.display = display
+        self.stream = stream
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.frames_lost = 0
+        self.error = None
+        self._queue = Queue(max_pending)
+        self._start = None
+        self._thread = None
+
+    def run(self, app: IApplication) -> None:
+        display = self.display
+        display_image = display.display_image
+
+        def recording_display_image(image):
+            display_image(image)
+            self.record(image)
+
+        # Shadow the method of this one display, frames that are skipped by
+        # the pacer are never shown and are not recorded either
+        display.display_image = recording_display_image
+        self.start()
+        try:
+            return display.run(app)
+        finally:
+            del display.display_image
+            self.stop()
+
+    def start(self) -> None:
+        """
+        Start the writer thread
+        """
+        self._start = monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name="textland-cast", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write all the pending frames and stop the writer thread
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        # Don't wait forever on a full queue if the writer died anyway
+        while thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+            except Full:
+                continue
+            break
+        thread.join()
+        self._thread = None
+
+    def record(self, image: TextImage) -> None:
+        """
+        Record one frame, without waiting for it to be written
+        """
+        if self._queue.full():
+            self.frames_dropped += 1
+            return
+        copy = TextImage(image.size)
+        copy.copy_from(image)
+        try:
+            self._queue.put_nowait((monotonic() - self._start, copy))
+        except Full:
+            self.frames_dropped += 1
+        else:
+            self.frames_recorded += 1
+
+    def _run(self) -> None:
+        encoder = OutputEncoder()
+        last = None
+        queue = self._queue
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                self.frames_lost += 1
+                continue
+            timestamp, image = item
+            try:
+                self._write_frame(encoder, timestamp, image, last)
+                if queue.empty():
+                    self.stream.flush()
+            except (OSError, ValueError) as exc:
+                # ValueError is raised when the stream was closed
+                self.error = exc
+                self.frames_lost += 1
+            last = image
+        if self.error is None:
+            try:
+                self.stream.flush()
+            except (OSError, ValueError) as exc:
+                self.error = exc
+
+    def _write_frame(self, encoder: OutputEncoder, timestamp: float,
+                     image: TextImage, last: TextImage) -> None:
+        """
+        Write one frame, *last* is the frame written before it or None
+        """
+        if last is None:
+            self._write_header(image)
+        elif last.size != image.size:
+            self._write_event(timestamp, 'r', '{}x{}'.format(
+                image.size.width, image.size.height))
+            last = None
+        data = encoder.encode_frame(image, last)
+        if data:
+            self._write_event(timestamp, 'o', data.decode('UTF-8'))
+
+    def _write_header(self, image: TextImage) -> None:
+        header = {
+            'version': 2,
+            'width': image.size.width,
+            'height': image.size.height,
+            'timestamp': int(time()),
+            'env': {'TERM': getenv('TERM', 'xterm')},
+        }
+        self.stream.write(json.dumps(header) + '\n')
+
+    def _write_event(self, timestamp: float, code: str, data: str) -> None:
+        self.stream.write(json.dumps(
+            [round(timestamp, 6), code, data], ensure_ascii=False) + '\n')
@@ -0,0 +1,107 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Colors beyond the 16 ANSI colors.
+
+A color is an integer. Values 0 to 255 are indices into the xterm
+256-color palette: the 16 ANSI colors, a 6x6x6 color cube and a ramp of
+24 grays. Values created with rgb() are 24-bit (true) colors. Terminals
+that support fewer colors get the nearest color they can display.
+"""
+
+# Flag set on colors created by rgb()
+TRUECOLOR = 1 << 24
+
+# Mask covering all the possible color values
+COLOR_MASK = TRUECOLOR | 0xffffff
+
+# Default RGB values of the 16 ANSI colors, as used by xterm
+_ANSI_RGB = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+    (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+
+# Intensity of each step of the 6x6x6 color cube
+_CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+# Memoized results of to_16()
+_nearest_16 = {}
+
+
+def rgb(r: int, g: int, b: int) -> int:
+    """
+    Get a 24-bit color with the specified red, green and blue components
+    """
+    return TRUECOLOR | ((r & 255) << 16) | ((g & 255) << 8) | (b & 255)
+
+
+def to_rgb(color: int) -> (int, int, int):
+    """
+    Get the (r, g, b) components of any color
+    """
+    if color & TRUECOLOR:
+        return (color >> 16) & 255, (color >> 8) & 255, color & 255
+    if color < 16:
+        return _ANSI_RGB[color]
+    if color < 232:
+        index = color - 16
+        return (_CUBE_LEVELS[index // 36], _CUBE_LEVELS[index // 6 % 6],
+                _CUBE_LEVELS[index % 6])
+    gray = 8 + (color - 232) * 10
+    return gray, gray, gray
+
+
+def _distance(a: tuple, b: tuple) -> int:
+    return sum((i - j) * (i - j) for i, j in zip(a, b))
+
+
+def _cube_index(value: int) -> int:
+    return min(range(6), key=lambda i: abs(_CUBE_LEVELS[i] - value))
+
+
+def to_256(color: int) -> int:
+    """
+    Get the nearest color of the 256-color palette
+    """
+    if not color & TRUECOLOR:
+        return color
+    r, g, b = to_rgb(color)
+    cube = 16 + 36 * _cube_index(r) + 6 * _cube_index(g) + _cube_index(b)
+    gray = 232 + min(23, max(0, (r + g + b) // 3 - 3) // 10)
+    if _distance(to_rgb(gray), (r, g, b)) < _distance(
+            to_rgb(cube), (r, g, b)):
+        return gray
+    return cube
+
+
+def to_16(color: int) -> int:
+    """
+    Get the nearest of the 16 ANSI colors
+    """
+    if color < 16:
+        return color
+    try:
+        return _nearest_16[color]
+    except KeyError:
+        target = to_rgb(color)
+        nearest = _nearest_16[color] = min(
+            range(16), key=lambda i: _distance(_ANSI_RGB[i], target))
+        return nearest
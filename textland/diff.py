@@ -0,0 +1,110 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Frame differencing.
+
+Rows of consecutive frames are compared by their hashes, as computed by
+TextImage.row_hashes(). Apart from finding rows that have changed, this
+detects blocks of rows that have moved up or down, which terminals can
+shift with a single scroll-region operation, similar to the hashmap
+optimization in ncurses.
+"""
+
+from collections import namedtuple
+
+# Vertical shift of rows *top* to *bottom* (inclusive) by *amount* rows.
+# Positive amounts move the content up, like curses.window.scroll().
+Scroll = namedtuple('Scroll', ['top', 'bottom', 'amount'])
+
+# Minimum number of moved rows worth a scroll operation
+_MIN_MOVED_ROWS = 2
+
+
+def find_scroll(old: list, new: list) -> Scroll:
+    """
+    Find the largest block of rows that moved vertically between frames
+
+    :param old:
+        Row hashes of the previous frame
+    :param new:
+        Row hashes of the next frame
+    :returns:
+        A Scroll describing the scroll region and the shift or None if no
+        block of rows worth scrolling has moved.
+    """
+    height = len(new)
+    if len(old) != height:
+        return None
+    # Rows that appear exactly once in the old frame anchor the search
+    where = {}
+    for y, row_hash in enumerate(old):
+        where[row_hash] = None if row_hash in where else y
+    best_length = _MIN_MOVED_ROWS - 1
+    best = None
+    covered = set()
+    for y, row_hash in enumerate(new):
+        old_y = where.get(row_hash)
+        if old_y is None or old_y == y or (y, old_y - y) in covered:
+            continue
+        shift = old_y - y
+        # Grow the matching block both ways, duplicated rows included
+        top = y
+        while top > 0 and 0 <= top - 1 + shift and (
+                new[top - 1] == old[top - 1 + shift]):
+            top -= 1
+        bottom = y
+        while bottom < height - 1 and bottom + 1 + shift < height and (
+                new[bottom + 1] == old[bottom + 1 + shift]):
+            bottom += 1
+        covered.update((row, shift) for row in range(top, bottom + 1))
+        if bottom - top + 1 > best_length:
+            best_length = bottom - top + 1
+            best = (top, bottom, shift)
+    if best is None:
+        return None
+    top, bottom, shift = best
+    if shift > 0:
+        return Scroll(top, bottom + shift, shift)
+    else:
+        return Scroll(top + shift, bottom, shift)
+
+
+def apply_scroll(hashes: list, scroll: Scroll) -> list:
+    """
+    Compute row hashes of a frame after applying a scroll operation
+
+    Rows exposed by the scroll operation get a hash of None.
+    """
+    result = list(hashes)
+    for y in range(scroll.top, scroll.bottom + 1):
+        src = y + scroll.amount
+        if scroll.top <= src <= scroll.bottom:
+            result[y] = hashes[src]
+        else:
+            result[y] = None
+    return result
+
+
+def changed_rows(old: list, new: list) -> list:
+    """
+    Get the list of indices of rows that differ between two frames
+    """
+    if len(old) != len(new):
+        return list(range(len(new)))
+    return [y for y, (a, b) in enumerate(zip(old, new)) if a != b]
@@ -17,29 +17,66 @@
 # along with Textland.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import abstractmethod
+from collections import OrderedDict
 from collections import deque
-from copy import deepcopy
 from os import getenv
-
+import os
+import select
+import sys
+try:
+    import termios
+except ImportError:
+    termios = None
+
+from . import ansi
 from . import keys
 from .abc import IApplication
 from .abc import IDisplay
+from .ansi import InputParser
 from .bits import Size
-from .events import EVENT_KEYBOARD, EVENT_RESIZE
-from .events import Event, KeyboardData
+from .color import to_16
+from .color import to_256
+from .diff import Scroll
+from .diff import apply_scroll
+from .diff import changed_rows
+from .diff import find_scroll
+from .encoder import OutputEncoder
+from .events import BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT
+from .events import EVENT_KEYBOARD, EVENT_MOUSE, EVENT_RESIZE
+from .events import Event, KeyboardData, MouseData
+from .events import MOUSE_MOTION, MOUSE_PRESS, MOUSE_RELEASE
+from .events import WHEEL_DOWN, WHEEL_UP
+from .events import coalesce_motion
+from .events import is_motion
 from .image import BLACK
 from .image import REVERSE
 from .image import TextAttributes
 from .image import TextImage
 from .image import UNDERLINE
 from .image import WHITE
+from .inputthread import InputThread
+from .pacing import FramePacer
+from .resize import ResizeMonitor
+from .resize import terminal_size
+from .sink import ListSink
+from .terminfo import TerminalCapabilities
+from .terminfo import load_capabilities
+from .width import CONTINUATION
 
 
 class AbstractDisplay(IDisplay):
     """
     Abstract display class.
+
+    Displays with a FramePacer in the *pacer* attribute skip frames that
+    would be shown too soon after the previous one when more events are
+    already waiting to be handled.
     """
 
+    pacer = None
+    # The InputThread of displays that read input in the background
+    _input = None
+
     def run(self, app: IApplication) -> None:
         """
         Run forever, feeding events to the controller
@@ -49,7 +86,7 @@ class AbstractDisplay(IDisplay):
         size = self.get_display_size()
         try:
             image = app.consume_event(Event(EVENT_RESIZE, size))
-            self.display_image(image)
+            self._show_image(image)
         except StopIteration:
             return
         # Then keep on running until the app raises StopIteration
@@ -59,13 +96,49 @@ class AbstractDisplay(IDisplay):
                 # but this is a hack that is not really applicable for curses
                 event = self.wait_for_event()
                 image = app.consume_event(event)
+                while self._should_skip_frame():
+                    image = app.consume_event(self.wait_for_event())
             except StopIteration as exc:
                 if exc.args:
                     return exc.args[0]
                 else:
                     break
             else:
-                self.display_image(image)
+                self._show_image(image)
+
+    def _should_skip_frame(self) -> bool:
+        pacer = self.pacer
+        if pacer is None or pacer.is_due() or not self.has_pending_event():
+            return False
+        pacer.skip_frame()
+        return True
+
+    def _show_image(self, image: TextImage) -> None:
+        pacer = self.pacer
+        if pacer is None:
+            self.display_image(image)
+        else:
+            pacer.begin_frame()
+            self.display_image(image)
+            pacer.end_frame()
+
+    def has_pending_event(self) -> bool:
+        """
+        Check if wait_for_event() would return without waiting
+        """
+        return False
+
+    def post_event(self, event: Event) -> None:
+        """
+        Post an event from any thread, waking up the display
+
+        This requires threaded input. Other threads can use this to have
+        the application do some work, like repainting, in the thread that
+        runs the display.
+        """
+        if self._input is None:
+            raise ValueError("threaded input is not running")
+        self._input.post(event)
 
     @abstractmethod
     def display_image(self, image: TextImage) -> None:
@@ -91,18 +164,61 @@ class PrintDisplay(AbstractDisplay):
     A display that uses regular print() and input()
     """
 
-    def __init__(self, size=Size(80, 25)):
+    def __init__(self, size=Size(80, 25), changes_only: bool=False,
+                 full_frame_every: int=50):
+        """
+        Initialize a new print display
+
+        :param size:
+            Size of the display
+        :param changes_only:
+            If True, each frame starts with a ``frame N`` line followed by
+            only the rows that changed since the previous frame, as
+            ``row N: ...`` lines. This keeps logs of long scripted sessions
+            small.
+        :param full_frame_every:
+            In the change-only mode, print the whole frame every that many
+            frames anyway, so that logs can be read from any point. Zero
+            means never, only the first frame and frames of a new size are
+            printed whole.
+        """
+        if full_frame_every < 0:
+            raise ValueError("full_frame_every cannot be negative")
         self.screen = TextImage(size)
+        self.changes_only = changes_only
+        self.full_frame_every = full_frame_every
+        self._frames = 0
+        self._last_hashes = None
+        self._last_size = None
 
     def display_image(self, image: TextImage) -> None:
-        text_buffer = image.text_buffer
-        width = self.screen.size.width
-        height = self.screen.size.height
-        print("/{}\\".format('=' * width))
-        for y in range(height):
-            line = text_buffer[y * width: (y + 1) * width].tounicode()
-            print("|{}|".format(line))
-        print("\\{}/".format('=' * width))
+        hashes = image.row_hashes()
+        every = self.full_frame_every
+        if not self.changes_only:
+            lines = self._full_frame(image)
+        elif self._last_size != image.size or (
+                every and self._frames % every == 0):
+            lines = ["frame {}\n".format(self._frames)]
+            lines.extend(self._full_frame(image))
+        else:
+            # The marker shows frames where nothing changed, too
+            lines = ["frame {}\n".format(self._frames)]
+            lines.extend("row {}: {}\n".format(y, image.row_text(y))
+                         for y in changed_rows(self._last_hashes, hashes))
+        self._frames += 1
+        self._last_hashes = list(hashes)
+        self._last_size = image.size
+        # One write per frame
+        sys.stdout.write(''.join(lines))
+        sys.stdout.flush()
+
+    def _full_frame(self, image: TextImage) -> list:
+        width = image.size.width
+        lines = ["/{}\\\n".format('=' * width)]
+        for y in range(image.size.height):
+            lines.append("|{}|\n".format(image.row_text(y)))
+        lines.append("\\{}/\n".format('=' * width))
+        return lines
 
     def get_display_size(self) -> Size:
         return self.screen.size
@@ -127,16 +243,120 @@ class PrintDisplay(AbstractDisplay):
                     print("Type command name or exactly one letter")
 
 
+class ColorPairAllocator:
+    """
+    Allocator of curses color pairs
+
+    Pairs are initialized the first time a combination of colors is used.
+    When all the pairs are taken the least recently used pair is evicted
+    and initialized again with the new combination of colors.
+    """
+
+    def __init__(self, init_pair, capacity: int, on_evict=None):
+        """
+        Initialize a new allocator
+
+        :param init_pair:
+            Function used to initialize a pair, usually curses.init_pair
+        :param capacity:
+            Number of pairs, numbered from 1, that can be allocated. Pair 0
+            cannot be changed in curses and is never allocated.
+        :param on_evict:
+            Optional function called with the number of each evicted pair
+        """
+        self._init_pair = init_pair
+        self.capacity = capacity
+        self._on_evict = on_evict
+        # (fg, bg) -> pair, from the least to the most recently used
+        self._pairs = OrderedDict()
+        # pair -> (fg, bg)
+        self._colors = {}
+        self.evictions = 0
+
+    def get(self, fg: int, bg: int) -> int:
+        """
+        Get the number of the pair with the specified colors
+
+        The pair is marked as the most recently used one.
+        """
+        key = (fg, bg)
+        try:
+            pair = self._pairs[key]
+        except KeyError:
+            pass
+        else:
+            self._pairs.move_to_end(key)
+            return pair
+        if len(self._pairs) < self.capacity:
+            pair = len(self._pairs) + 1
+        else:
+            pair = self._pairs.popitem(last=False)[1]
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(pair)
+        self._init_pair(pair, fg, bg)
+        self._pairs[key] = pair
+        self._colors[pair] = key
+        return pair
+
+    def touch(self, pair: int) -> None:
+        """
+        Mark an allocated pair as the most recently used one
+        """
+        self._pairs.move_to_end(self._colors[pair])
+
+
+class _AttributeCache(dict):
+    """
+    Mapping from packed attributes to curses attributes, filled on demand
+    """
+
+    def __init__(self, translate):
+        self._translate = translate
+
+    def __missing__(self, pa: int) -> int:
+        curses_attr = self[pa] = self._translate(pa)
+        return curses_attr
+
+
 class CursesDisplay(AbstractDisplay):
     """
     A display using python curses module
     """
 
-    def __init__(self):
+    def __init__(self, pacer: FramePacer=None, threaded_input: bool=False,
+                 mouse: bool=False):
+        """
+        Initialize a new curses display
+
+        :param pacer:
+            FramePacer used to adapt the frame rate to the terminal. By
+            default a new pacer is created.
+        :param threaded_input:
+            If True, input is read and parsed by an InputThread instead of
+            curses, so it is never held up by a frame being written. See
+            InputThread for the thread-safety rules that apply then.
+        :param mouse:
+            If True, mouse buttons and drags are reported as EVENT_MOUSE
+        """
         import curses
         self._curses = curses
         self._screen = None
-        self._curses_attr = [0] * 0xffff
+        self.pacer = pacer if pacer is not None else FramePacer()
+        self._threaded_input = threaded_input
+        self._input = None
+        self._mouse = mouse
+        # Buttons held down, as seen in the mouse events of curses
+        self._mouse_buttons = 0
+        self._resize = None
+        self._curses_attr = _AttributeCache(self._pa_to_curses)
+        # Number of colors of the terminal and the color pair allocator,
+        # both set once colors have been started.
+        self._colors = 0
+        self._pairs = None
+        # Row hashes of the image currently on screen
+        self._last_hashes = None
+        self._last_width = None
 
     def _pa_to_curses(self, pa: int) -> int:
         """
@@ -149,7 +369,8 @@ class CursesDisplay(AbstractDisplay):
         Check urwid documentation for general terminal supports:
         http://urwid.org/manual/displayattributes.html#foreground-and-background-settings
 
-        As curses only supports A_BOLD, bright backgrounds are not supported.
+        On terminals with only 8 colors, curses only supports A_BOLD, so
+        bright backgrounds are not supported there.
         Only ANSI escape codes ANSI supports backgound intensity, see:
         http://en.wikipedia.org/wiki/ANSI_escape_code
 
@@ -158,6 +379,9 @@ class CursesDisplay(AbstractDisplay):
         generally should be avoided. If you are in a high-color mode you
         might have better luck using the high-color versions", see:
         http://urwid.org/manual/displayattributes.html#bright-background-colors
+
+        Colors the terminal cannot display are replaced by the nearest
+        color from the 256-color palette or from the 16 ANSI colors.
         """
         fg, bg, style = TextAttributes.unpack(pa)
         curses_attr = 0
@@ -167,26 +391,78 @@ class CursesDisplay(AbstractDisplay):
             curses_attr |= self._curses.A_REVERSE
         if style & UNDERLINE:
             curses_attr |= self._curses.A_UNDERLINE
-        if fg > 7:
-            curses_attr |= self._curses.A_BOLD  # Bright foreground colors
-            fg -= 8
-        if bg > 7:
-            bg -= 8  # Bright backgrounds are not supported
-        curses_attr |= self._curses.color_pair(self._pair_index(fg, bg))
+        if self._colors >= 256:
+            fg = to_256(fg)
+            bg = to_256(bg)
+        else:
+            fg = to_16(fg)
+            bg = to_16(bg)
+            if self._colors < 16:
+                if fg > 7:
+                    curses_attr |= self._curses.A_BOLD  # Bright foreground
+                    fg -= 8
+                if bg > 7:
+                    bg -= 8  # Bright backgrounds are not supported
+        if self._pairs is not None:
+            curses_attr |= self._curses.color_pair(self._pair(fg, bg))
         return curses_attr
 
-    def _pair_index(self, fg: int, bg: int) -> int:
+    def _pair(self, fg: int, bg: int) -> int:
         # XXX: Support the default colors (-1)
-        #return (bg + 2) * 9 - fg - 2
-        return bg * 8 + 7 - fg
+        if fg == WHITE and bg == BLACK:
+            return 0  # The fixed, default pair
+        return self._pairs.get(fg, bg)
+
+    def _forget_pair(self, pair: int) -> None:
+        """
+        Forget all the translated attributes using an evicted color pair
+        """
+        pair_number = self._curses.pair_number
+        for pa, curses_attr in list(self._curses_attr.items()):
+            if pair_number(curses_attr) == pair:
+                del self._curses_attr[pa]
 
     def run(self, app: IApplication) -> None:
         try:
             self._init_curses()
+            # This replaces the SIGWINCH handler of curses
+            self._resize = ResizeMonitor(sys.stdout.fileno())
+            self._resize.start()
+            if self._threaded_input:
+                self._start_input_thread()
             return super().run(app)
         finally:
+            self._stop_input_thread()
+            if self._resize is not None:
+                self._resize.stop()
+                self._resize = None
             self._fini_curses()
 
+    def _start_input_thread(self) -> None:
+        # Curses must not look for typeahead on its own as the input now
+        # belongs to the input thread.
+        self._curses.typeahead(-1)
+        if self._mouse:
+            # The input thread only understands SGR mouse reports
+            self._curses.mousemask(0)
+            self._write_tty(ansi.ENABLE_MOUSE)
+        self._input = InputThread(sys.stdin.fileno())
+        self._input.start()
+
+    def _stop_input_thread(self) -> None:
+        if self._input is not None:
+            self._input.stop()
+            self._input = None
+            if self._mouse:
+                self._write_tty(ansi.DISABLE_MOUSE)
+
+    def _write_tty(self, sequence: str) -> None:
+        """
+        Write an escape sequence that curses doesn't know about
+        """
+        sys.stdout.write(sequence)
+        sys.stdout.flush()
+
     def _init_curses(self):
         self._screen = self._curses.initscr()
         if self._curses.has_colors():
@@ -198,59 +474,190 @@ class CursesDisplay(AbstractDisplay):
         self._curses.noecho()
         self._curses.cbreak()
         self._screen.keypad(1)
+        if self._mouse:
+            self._curses.mousemask(
+                self._curses.ALL_MOUSE_EVENTS
+                | self._curses.REPORT_MOUSE_POSITION)
+            # Report presses and releases right away, not as clicks
+            self._curses.mouseinterval(0)
 
     def _setup_color_pairs(self):
         """
-        Initialize all the color pairs based on the _pair_index() formula.
-        To select the right color combination, we just need to use the right
-        color pair number.
+        Prepare to allocate color pairs as they are needed.
+
+        Only pairs below 256 can be expressed in curses attributes so at
+        most 255 pairs (pair 0 is fixed) are used at any time.
         """
-        # XXX: hardcode 8, since curses.COLORS could be larger than the
-        # portable set of 64 color pairs
-        for fg in range(8):
-            for bg in range(8):
-                if fg == WHITE and bg == BLACK:
-                    continue
-                self._curses.init_pair(self._pair_index(fg, bg), fg, bg)
-        self._curses_attr = [self._pa_to_curses(i) for i in range(0xffff)]
+        self._colors = self._curses.COLORS
+        self._pairs = ColorPairAllocator(
+            self._curses.init_pair,
+            min(self._curses.COLOR_PAIRS, 256) - 1,
+            self._forget_pair)
+        self._curses_attr.clear()
 
     def _fini_curses(self):
+        if self._mouse:
+            self._curses.mousemask(0)
         if self._screen is not None:
             self._screen.keypad(0)
         self._curses.echo()
         self._curses.nocbreak()
         self._curses.endwin()
 
+    def _use_attributes(self, image: TextImage, rows) -> bool:
+        """
+        Make sure all the attributes used by some rows can be displayed
+
+        :returns:
+            True if any color pair already on screen had to be evicted
+        """
+        if self._pairs is None:
+            return False
+        evictions = self._pairs.evictions
+        curses_attr = self._curses_attr
+        pair_number = self._curses.pair_number
+        for pa in image.attributes_used(rows):
+            pair = pair_number(curses_attr[pa])
+            if pair != 0:
+                # Mark the pair as used by this frame
+                self._pairs.touch(pair)
+        return self._pairs.evictions != evictions
+
     def display_image(self, image: TextImage) -> None:
+        hashes = image.row_hashes()
+        old = self._last_hashes
+        scroll = None
+        if old is None or len(old) != len(hashes) or (
+                self._last_width != image.size.width):
+            old = [None] * len(hashes)
+        else:
+            scroll = find_scroll(old, hashes)
+            if scroll is not None:
+                old = apply_scroll(old, scroll)
+        rows = changed_rows(old, hashes)
+        # Only the rows being drawn need their color pairs
+        if self._use_attributes(image, rows):
+            # A pair still used by rows on screen may have been evicted
+            rows = range(len(hashes))
+            self._use_attributes(image, rows)
+            scroll = None
+        if scroll is not None:
+            self._scroll(scroll)
+        for y in rows:
+            self._draw_row(image, y)
+        self._screen.refresh()
+        self._drain()
+        self._last_hashes = hashes
+        self._last_width = image.size.width
+
+    def _drain(self) -> None:
+        """
+        Wait until the terminal has received all the output
+
+        This way the time spent in display_image() reflects the speed of
+        the terminal and output never piles up in the tty buffers.
+        """
+        if termios is None or self.pacer is None:
+            return
+        try:
+            termios.tcdrain(sys.stdout.fileno())
+        except (termios.error, OSError, ValueError):
+            pass
+
+    def _scroll(self, scroll: Scroll) -> None:
+        """
+        Shift a block of rows already on screen
+        """
+        screen = self._screen
+        screen.scrollok(True)
+        screen.setscrreg(scroll.top, scroll.bottom)
+        screen.scroll(scroll.amount)
+        screen.setscrreg(0, screen.getmaxyx()[0] - 1)
+        screen.scrollok(False)
+
+    def _draw_row(self, image: TextImage, y: int) -> None:
+        """
+        Draw one row of the image on the screen
+        """
         width = image.size.width
-        height = image.size.height
-        for y in range(height - 1):
+        curses_attr = self._curses_attr
+        if y < image.size.height - 1:
             for x in range(width):
                 cell = image.get(x, y)
+                # The wide character to the left already covers this cell
+                if cell.char == CONTINUATION:
+                    continue
                 self._screen.addstr(
-                    y, x, cell.char, self._curses_attr[cell.attributes])
-        y += 1
-        for x in range(1, width):
+                    y, x, cell.char, curses_attr[cell.attributes])
+            return
+        # Writing to the bottom-right cell would scroll the screen so the
+        # last row is written shifted left by the width of the first
+        # character, which is then inserted back at the start of the row.
+        first = image.get(0, y)
+        shift = 1
+        if width > 1 and image.get(1, y).char == CONTINUATION:
+            shift = 2
+        for x in range(shift, width):
             cell = image.get(x, y)
+            if cell.char == CONTINUATION:
+                continue
             self._screen.addstr(
-                y, x - 1, cell.char, self._curses_attr[cell.attributes])
-        cell = image.get(0, y)
-        self._screen.insstr(
-            y, 0, cell.char, self._curses_attr[cell.attributes])
-        self._screen.refresh()
+                y, x - shift, cell.char, curses_attr[cell.attributes])
+        self._screen.insstr(y, 0, first.char, curses_attr[first.attributes])
 
     def get_display_size(self) -> Size:
         y, x = self._screen.getmaxyx()
         return Size(x, y)
 
+    def has_pending_event(self) -> bool:
+        if self._resize.size_changed():
+            return True
+        if self._input is not None:
+            return self._input.has_event()
+        key_code = self._getch_nodelay()
+        if key_code == -1:
+            return False
+        self._curses.ungetch(key_code)
+        return True
+
+    def _getch_nodelay(self) -> int:
+        """
+        Get the next key code from curses or -1 if there is none
+        """
+        self._screen.nodelay(1)
+        try:
+            return self._screen.getch()
+        finally:
+            self._screen.nodelay(0)
+
+    def _resized(self, size: Size) -> Event:
+        """
+        Let curses know about the new size of the terminal
+        """
+        self._curses.resizeterm(size.height, size.width)
+        return Event(EVENT_RESIZE, self.get_display_size())
+
     def wait_for_event(self) -> Event:
-        key_code = self._screen.getch()
-        # throw away all typeaheads
-        self._curses.flushinp()
-        # XXX -1 is for OSX
-        if key_code == self._curses.KEY_RESIZE or key_code == -1:
-            return Event(EVENT_RESIZE, self.get_display_size())
-        elif key_code == self._curses.KEY_UP:
+        if self._input is not None:
+            return self._wait_for_threaded_event()
+        resize = self._resize
+        while True:
+            size = resize.poll()
+            if size is not None:
+                return self._resized(size)
+            # Keys may already be buffered by curses, so ask curses first
+            key_code = self._getch_nodelay()
+            if key_code == self._curses.KEY_RESIZE:
+                resize.notify()  # Noticed by curses itself
+            elif key_code == self._curses.KEY_MOUSE:
+                event = self._get_mouse_event()
+                if event is not None:
+                    return event
+            elif key_code != -1:
+                break
+            select.select([sys.stdin.fileno(), resize.fileno()], [], [],
+                          resize.timeout())
+        if key_code == self._curses.KEY_UP:
             return Event(EVENT_KEYBOARD, KeyboardData(keys.KEY_UP))
         elif key_code == self._curses.KEY_DOWN:
             return Event(EVENT_KEYBOARD, KeyboardData(keys.KEY_DOWN))
@@ -265,23 +672,252 @@ class CursesDisplay(AbstractDisplay):
         else:
             return Event(EVENT_KEYBOARD, KeyboardData(chr(key_code)))
 
+    def _get_mouse_event(self) -> Event:
+        """
+        Get the mouse event reported by curses, coalescing motion
+
+        :returns:
+            The event or None if it is not a kind of event textland knows
+        """
+        try:
+            event = self._mouse_event(self._curses.getmouse())
+        except self._curses.error:
+            return None
+        while event is not None and is_motion(event):
+            # Skip to the last of consecutive motion events
+            key_code = self._getch_nodelay()
+            if key_code != self._curses.KEY_MOUSE:
+                if key_code != -1:
+                    self._curses.ungetch(key_code)
+                break
+            state = self._curses.getmouse()
+            following = self._mouse_event(state, peek=True)
+            if (following is None or not is_motion(following)
+                    or following.data.buttons != event.data.buttons):
+                self._curses.ungetmouse(*state)
+                break
+            event = following
+        return event
+
+    def _mouse_event(self, state: tuple, peek: bool=False) -> Event:
+        """
+        Translate the state returned by curses.getmouse()
+
+        :param peek:
+            If True, the buttons held down are not updated
+        """
+        _, x, y, _, bstate = state
+        curses = self._curses
+        for button, number in ((BUTTON_LEFT, 1), (BUTTON_MIDDLE, 2),
+                               (BUTTON_RIGHT, 3)):
+            if bstate & getattr(curses, 'BUTTON{}_PRESSED'.format(number)):
+                if not peek:
+                    self._mouse_buttons |= button
+                return Event(EVENT_MOUSE, MouseData(x, y, button, MOUSE_PRESS))
+            if bstate & getattr(curses, 'BUTTON{}_RELEASED'.format(number)):
+                if not peek:
+                    self._mouse_buttons &= ~button
+                return Event(EVENT_MOUSE, MouseData(
+                    x, y, button, MOUSE_RELEASE))
+        if bstate & curses.BUTTON4_PRESSED:
+            return Event(EVENT_MOUSE, MouseData(x, y, WHEEL_UP, MOUSE_PRESS))
+        if bstate & getattr(curses, 'BUTTON5_PRESSED', 0):
+            return Event(EVENT_MOUSE, MouseData(x, y, WHEEL_DOWN, MOUSE_PRESS))
+        if bstate & curses.REPORT_MOUSE_POSITION:
+            return Event(EVENT_MOUSE, MouseData(
+                x, y, self._mouse_buttons, MOUSE_MOTION))
+        return None
+
+    def _wait_for_threaded_event(self) -> Event:
+        resize = self._resize
+        while True:
+            size = resize.poll()
+            if size is not None:
+                return self._resized(size)
+            event = self._input.get_event(
+                resize.timeout(), [resize.fileno()])
+            if event is not None:
+                return event
+            if self._input.closed:
+                raise StopIteration  # End of input
+
+
+class AnsiDisplay(AbstractDisplay):
+    """
+    A display writing ANSI escape sequences directly to the terminal
+
+    This display doesn't need curses. Only the changes since the previous
+    frame are sent, encoded with the fewest bytes OutputEncoder can find.
+    """
+
+    def __init__(self, fd_in: int=None, fd_out: int=None,
+                 pacer: FramePacer=None, threaded_input: bool=False,
+                 mouse: bool=False,
+                 capabilities: TerminalCapabilities=None):
+        """
+        Initialize a new ANSI display
+
+        :param fd_in:
+            File descriptor of the terminal input, stdin by default
+        :param fd_out:
+            File descriptor of the terminal output, stdout by default
+        :param pacer:
+            FramePacer used to adapt the frame rate to the terminal. By
+            default a new pacer is created.
+        :param threaded_input:
+            If True, input is read and parsed by an InputThread so it is
+            never held up by a frame being written. See InputThread for the
+            thread-safety rules that apply then.
+        :param mouse:
+            If True, mouse buttons and drags are reported as EVENT_MOUSE
+        :param capabilities:
+            Capabilities of the terminal, by default the (cached)
+            capabilities of $TERM
+        """
+        if termios is None:
+            raise ImportError("termios is not available")
+        if capabilities is None:
+            capabilities = load_capabilities()
+        self._fd_in = sys.stdin.fileno() if fd_in is None else fd_in
+        self._fd_out = sys.stdout.fileno() if fd_out is None else fd_out
+        self.pacer = pacer if pacer is not None else FramePacer()
+        if getenv("COLORTERM") in ("truecolor", "24bit"):
+            self.encoder = OutputEncoder()
+        else:
+            self.encoder = OutputEncoder(capabilities.colors)
+        self._parser = InputParser(capabilities.keys)
+        self._events = deque()
+        self._last_image = None
+        self._saved_attrs = None
+        self._resize = ResizeMonitor(self._fd_out)
+        self._threaded_input = threaded_input
+        self._input = None
+        self._mouse = mouse
+
+    def run(self, app: IApplication) -> None:
+        try:
+            self._init_terminal()
+            if self._threaded_input:
+                self._input = InputThread(self._fd_in, self._parser)
+                self._input.start()
+            return super().run(app)
+        finally:
+            if self._input is not None:
+                self._input.stop()
+                self._input = None
+            self._fini_terminal()
+
+    def _init_terminal(self) -> None:
+        self._saved_attrs = ansi.enter_raw_mode(self._fd_in, self._fd_out)
+        self._resize.start()
+        self._write(ansi.setup_sequences(self._mouse).encode('UTF-8'))
+
+    def _fini_terminal(self) -> None:
+        if self._saved_attrs is None:
+            return
+        self._write(ansi.teardown_sequences(self._mouse).encode('UTF-8'))
+        self._resize.stop()
+        ansi.leave_raw_mode(self._fd_in, self._fd_out, self._saved_attrs)
+        self._saved_attrs = None
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd_out, view):]
+
+    def display_image(self, image: TextImage) -> None:
+        data = self.encoder.encode_frame(image, self._last_image)
+        if self.pacer is not None:
+            self.pacer.add_bytes(len(data))
+        self._write(data)
+        if self.pacer is not None:
+            # Let the frame time reflect the speed of the terminal
+            try:
+                termios.tcdrain(self._fd_out)
+            except termios.error:
+                pass
+        if self._last_image is None:
+            self._last_image = TextImage(image.size)
+        self._last_image.copy_from(image)
+
+    def get_display_size(self) -> Size:
+        if self._resize.size is not None:
+            return self._resize.size  # The last size that was reported
+        return terminal_size(self._fd_out)
+
+    def has_pending_event(self) -> bool:
+        if self._resize.size_changed():
+            return True
+        if self._input is not None:
+            return self._input.has_event()
+        if self._events:
+            return True
+        return bool(select.select([self._fd_in], [], [], 0)[0])
+
+    def wait_for_event(self) -> Event:
+        resize = self._resize
+        while True:
+            size = resize.poll()
+            if size is not None:
+                return Event(EVENT_RESIZE, size)
+            if self._input is not None:
+                event = self._input.get_event(
+                    resize.timeout(), [resize.fileno()])
+                if event is not None:
+                    return event
+                if self._input.closed:
+                    raise StopIteration  # End of input
+                continue
+            if self._events:
+                return self._events.popleft()
+            timeout = resize.timeout()
+            if self._parser.has_pending_input:
+                # Give up waiting for the rest of incomplete escape
+                # sequences after a while
+                timeout = min(0.05, 0.05 if timeout is None else timeout)
+            ready = select.select(
+                [self._fd_in, resize.fileno()], [], [], timeout)[0]
+            if self._fd_in in ready:
+                data = os.read(self._fd_in, 4096)
+                if not data:
+                    raise StopIteration
+                self._queue_events(self._parser.feed(data))
+            elif not ready and self._parser.has_pending_input:
+                self._queue_events(self._parser.flush())
+
+    def _queue_events(self, events: list) -> None:
+        """
+        Queue parsed events, skipping to the last of consecutive motions
+        """
+        self._events.extend(events)
+        self._events = deque(coalesce_motion(self._events))
+
 
 class TestDisplay(AbstractDisplay):
     """
     A display that records all images and replays pre-recorded events
+
+    Images are handed to a frame sink, see textland.sink. By default all
+    of them are kept in a ListSink, which is also the screen_log attribute.
+    Long-running tests can use one of the other sinks to keep memory use
+    bounded.
     """
 
-    def __init__(self, size=Size(80, 25)):
-        self.screen_log = []
+    def __init__(self, size=Size(80, 25), sink=None):
+        self.sink = sink if sink is not None else ListSink()
+        self.screen_log = self.sink
         self.size = size
         self.events = deque()
 
     def display_image(self, image: TextImage) -> None:
-        self.screen_log.append(deepcopy(image))
+        self.sink.add_frame(image)
 
     def get_display_size(self) -> Size:
         return self.size
 
+    def has_pending_event(self) -> bool:
+        return bool(self.events)
+
     def wait_for_event(self) -> Event:
         try:
             return self.events.popleft()
@@ -309,8 +945,12 @@ def get_display(display=None) -> IDisplay:
         except ImportError:
             # Sized like that to fit 80x25 without any overflow
             return PrintDisplay(Size(77, 22))
+    elif display == "ansi":
+        return AnsiDisplay()
     elif display == "print":
         return PrintDisplay()
+    elif display == "print-changes":
+        return PrintDisplay(changes_only=True)
     elif display == "test":
         return TestDisplay()
     else:
@@ -16,13 +16,27 @@
 # You should have received a copy of the GNU General Public License
 # along with Textland.  If not, see <http://www.gnu.org/licenses/>.
 
-from .bits import Offset, Rect
+from collections import namedtuple
+
+from .bits import Offset, Rect, Region, Size
 from .image import TextImage, TextAttributes
+from .layout import WRAP_WORD, default_cache
+from .width import CONTINUATION, REPLACEMENT_CHARACTER
+from .width import char_width, text_width
+
+# Operations recorded in a DisplayList. The offset and clipping area in
+# effect at the time of recording are stored in each operation.
+FillOp = namedtuple('FillOp', ['clip', 'char', 'pa'])
+TextOp = namedtuple('TextOp', ['offset', 'clip', 'text', 'pa'])
+BorderOp = namedtuple('BorderOp', ['clip', 'margins', 'pa'])
 
 
 class DrawingContext:
     """
     Context for simple text drawing
+
+    The context can also record drawing operations into a DisplayList
+    instead of painting them, see begin_recording().
     """
 
     def __init__(self, image: TextImage):
@@ -30,22 +44,72 @@ class DrawingContext:
         self.offset = Offset(0, 0)
         self.clip = Rect(0, 0, image.size.width, image.size.height)
         self.attributes = TextAttributes()
+        self.display_list = None
+
+    def begin_recording(self) -> None:
+        """
+        Start recording drawing operations instead of painting them
+
+        Moving the offset and changing the clipping area work as usual and
+        are reflected in the recorded operations. The image is not touched
+        until the recorded display list is replayed.
+        """
+        self.display_list = DisplayList(self.image.size)
+
+    def end_recording(self) -> 'DisplayList':
+        """
+        Stop recording drawing operations
+
+        :returns:
+            The DisplayList with all the operations recorded since the call
+            to begin_recording()
+        """
+        display_list = self.display_list
+        self.display_list = None
+        return display_list
 
     def fill(self, c: str) -> None:
         packed_attr = self.attributes.packed
-        for x in range(self.clip.x1, self.clip.x2):
-            for y in range(self.clip.y1, self.clip.y2):
-                self.image.put(x, y, c, packed_attr)
+        if self.display_list is not None:
+            self.display_list.ops.append(FillOp(self.clip, c, packed_attr))
+        else:
+            self._fill(c, packed_attr)
+
+    def _fill(self, c: str, pa: int) -> None:
+        clip = self._visible_clip()
+        if clip.is_empty():
+            return
+        if char_width(c) == 2:
+            # One character every other cell, the last column stays blank
+            # when the width of the clipping area is odd
+            for y in range(clip.y1, clip.y2):
+                for x in range(clip.x1, clip.x2, 2):
+                    self._put_wide_x_y_c_pa(x, y, c, pa, clip)
+        else:
+            self.image.fill_rect(clip.x1, clip.y1, clip.x2, clip.y2, c, pa)
+
+    def _visible_clip(self) -> Rect:
+        """
+        Get the part of the clipping area that is inside the image
+        """
+        size = self.image.size
+        return self.clip.intersection(Rect(0, 0, size.width, size.height))
 
     def clip_to(self, x1: int, y1: int, x2: int, y2: int) -> None:
-        self.clip = Rect(x1, y1, x2, y2)
+        self.clip = Rect(x1, y1, x2, y2).normalized()
 
     def clip_by(self, dx1: int, dy1: int, dx2: int, dy2: int) -> None:
+        """
+        Move the edges of the clipping area by the specified deltas
+
+        Moving opposite edges past each other leaves an empty clipping
+        area, so that nothing is painted.
+        """
         x1 = self.clip.x1 + dx1
         y1 = self.clip.y1 + dy1
         x2 = self.clip.x2 + dx2
         y2 = self.clip.y2 + dy2
-        self.clip = Rect(x1, y1, x2, y2)
+        self.clip = Rect(x1, y1, x2, y2).normalized()
 
     def move_to(self, x: int, y: int) -> None:
         """
@@ -74,23 +138,59 @@ class DrawingContext:
             self._put_line(line, pa)
             self.move_by(0, 1)
 
+    def print_wrapped(self, text: str, mode: str=WRAP_WORD,
+                      ellipsis: str=None) -> None:
+        """
+        Print the specified text, wrapped to the clipping area
+
+        Lines are wrapped to fit between the current offset and the right
+        edge of the clipping area, either at word boundaries (WRAP_WORD) or
+        at any character (WRAP_CHAR). Text that doesn't fit above the
+        bottom edge is dropped. If *ellipsis* is set then the last visible
+        line is truncated and ends with it when any text was dropped.
+
+        The offset is automatically adjusted to point
+        to the line below the last printed line.
+        """
+        width = self.clip.x2 - self.offset.x
+        max_lines = max(0, self.clip.y2 - self.offset.y)
+        pa = self.attributes.packed
+        for line in default_cache.layout(
+                text, width, mode, max_lines, ellipsis):
+            self._put_line(line, pa)
+            self.move_by(0, 1)
+
     def border(self, lm=0, rm=0, tm=0, bm=0) -> None:
         """
         Draw a border around the edges of the current cli. Each parameter
         specifies the margin to use for a specific side of the border.
         """
         pa = self.attributes.packed
-        self._put_x_y_c_pa(self.clip.x1 + lm, self.clip.y1 + tm, '┌', pa)
-        self._put_x_y_c_pa(self.clip.x1 + lm, self.clip.y2 - 1 - bm, '└', pa)
-        self._put_x_y_c_pa(self.clip.x2 - rm - 1, self.clip.y1 + tm, '┐', pa)
-        self._put_x_y_c_pa(
-            self.clip.x2 - rm - 1, self.clip.y2 - 1 - bm, '┘', pa)
-        for x in range(self.clip.x1 + 1 + lm, self.clip.x2 - 1 - rm):
-            self._put_x_y_c_pa(x, self.clip.y1 + tm, '─', pa)
-            self._put_x_y_c_pa(x, self.clip.y2 - 1 - bm, '─', pa)
-        for y in range(self.clip.y1 + 1 + tm, self.clip.y2 - 1 - bm):
-            self._put_x_y_c_pa(self.clip.x1 + lm, y, '│', pa)
-            self._put_x_y_c_pa(self.clip.x2 - rm - 1, y, '│', pa)
+        if self.display_list is not None:
+            self.display_list.ops.append(
+                BorderOp(self.clip, (lm, rm, tm, bm), pa))
+        else:
+            self._border(lm, rm, tm, bm, pa)
+
+    def _border(self, lm: int, rm: int, tm: int, bm: int, pa: int) -> None:
+        visible = self._visible_clip()
+        if visible.is_empty():
+            return
+        x1 = self.clip.x1 + lm
+        y1 = self.clip.y1 + tm
+        x2 = self.clip.x2 - rm - 1
+        y2 = self.clip.y2 - bm - 1
+        put = self._put_x_y_c_pa
+        put(x1, y1, '┌', pa, visible)
+        put(x1, y2, '└', pa, visible)
+        put(x2, y1, '┐', pa, visible)
+        put(x2, y2, '┘', pa, visible)
+        for x in range(x1 + 1, x2):
+            put(x, y1, '─', pa, visible)
+            put(x, y2, '─', pa, visible)
+        for y in range(y1 + 1, y2):
+            put(x1, y, '│', pa, visible)
+            put(x2, y, '│', pa, visible)
 
     def _put_line(self, text: str, pa: int) -> None:
         """
@@ -98,15 +198,148 @@ class DrawingContext:
         """
         if "\n" in text:
             raise ValueError("should be without any newlines")
-        for dx, c in enumerate(text):
-            self._put_dx_dy_c_pa(dx, 0, c, pa)
+        if self.display_list is not None:
+            self.display_list.ops.append(
+                TextOp(self.offset, self.clip, text, pa))
+        elif text.isascii():
+            self._put_run(text, pa)
+        else:
+            self._put_wide_line(text, pa)
 
-    def _put_dx_dy_c_pa(self, dx: int, dy: int, c: str, pa: int) -> None:
-        x = self.offset.x + dx
-        y = self.offset.y + dy
-        self._put_x_y_c_pa(x, y, c, pa)
+    def _put_run(self, text: str, pa: int) -> None:
+        """
+        Print one line of narrow characters with one bulk write
+        """
+        x, y = self.offset
+        x1, y1, x2, y2 = self._visible_clip()
+        if not (y1 <= y < y2 and x1 < x2):
+            return
+        start = max(x, x1)
+        end = min(x + len(text), x2)
+        if start < end:
+            self.image.put_text(start, y, text[start - x:end - x], pa)
+
+    def _put_wide_line(self, text: str, pa: int) -> None:
+        """
+        Print one line that may contain wide characters
+        """
+        clip = self._visible_clip()
+        x, y = self.offset
+        if not (clip.y1 <= y < clip.y2 and clip.x1 < clip.x2):
+            return
+        for c in text:
+            width = char_width(c)
+            if width == 1:
+                if c == CONTINUATION:
+                    c = REPLACEMENT_CHARACTER
+                if clip.x1 <= x < clip.x2:
+                    self.image.put(x, y, c, pa)
+            elif width == 2:
+                self._put_wide_x_y_c_pa(x, y, c, pa, clip)
+            x += width
+
+    def _put_wide_x_y_c_pa(self, x: int, y: int, c: str, pa: int,
+                           clip: Rect) -> None:
+        """
+        Put a wide character, replacing it with a space if clipped in half
+        """
+        left = clip.x1 <= x < clip.x2
+        right = clip.x1 <= x + 1 < clip.x2
+        if left and right:
+            self.image.put(x, y, c, pa)
+            self.image.put(x + 1, y, CONTINUATION, pa)
+        elif left:
+            self.image.put(x, y, ' ', pa)
+        elif right:
+            self.image.put(x + 1, y, ' ', pa)
 
-    def _put_x_y_c_pa(self, x: int, y: int, c: str, pa: int) -> None:
-        if (self.clip.x1 <= x < self.clip.x2
-                and self.clip.y1 <= y < self.clip.y2):
+    def _put_x_y_c_pa(self, x: int, y: int, c: str, pa: int,
+                      clip: Rect) -> None:
+        if clip.contains_point(x, y):
             self.image.put(x, y, c, pa)
+
+
+class DisplayList:
+    """
+    Drawing operations recorded by a DrawingContext
+
+    Display lists are recorded for a specific image size and can be
+    replayed, any number of times, into any image of that size. Applications
+    can cache display lists of parts of the screen that rarely change.
+    """
+
+    def __init__(self, size: Size, ops: list=None):
+        self.size = size
+        self.ops = ops if ops is not None else []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def optimized(self) -> 'DisplayList':
+        """
+        Get an equivalent display list that does less work
+
+        Operations completely covered by later fills (even by several of
+        them together) are dropped, along with operations that are entirely
+        outside of the image. Consecutive fills with the same character and
+        attributes are merged when they form a rectangle together.
+        """
+        bounds = Rect(0, 0, self.size.width, self.size.height)
+        opaque = Region()
+        visible = []
+        for op in reversed(self.ops):
+            box = _op_extent(op).intersection(bounds)
+            if box.is_empty() or opaque.contains(box):
+                continue
+            if isinstance(op, FillOp):
+                opaque = opaque.union(Region([box]))
+                op = op._replace(clip=box)
+            visible.append(op)
+        visible.reverse()
+        ops = []
+        for op in visible:
+            if ops and isinstance(op, FillOp) and isinstance(ops[-1], FillOp):
+                last = ops[-1]
+                if last.char == op.char and last.pa == op.pa:
+                    merged = last.clip.merged(op.clip)
+                    if merged is not None:
+                        ops[-1] = last._replace(clip=merged)
+                        continue
+            ops.append(op)
+        return DisplayList(self.size, ops)
+
+    def replay(self, image: TextImage) -> None:
+        """
+        Paint all the recorded operations into *image*
+
+        :raises ValueError:
+            If the image doesn't have the size the list was recorded for
+        """
+        if image.size != self.size:
+            raise ValueError("display list was recorded for {}".format(
+                self.size))
+        ctx = DrawingContext(image)
+        for op in self.ops:
+            ctx.clip = op.clip
+            if isinstance(op, FillOp):
+                ctx._fill(op.char, op.pa)
+            elif isinstance(op, TextOp):
+                ctx.offset = op.offset
+                ctx._put_line(op.text, op.pa)
+            elif isinstance(op, BorderOp):
+                ctx._border(*op.margins, pa=op.pa)
+
+
+def _op_extent(op) -> Rect:
+    """
+    Get the rectangle of cells that an operation may paint to
+    """
+    clip = op.clip
+    if isinstance(op, TextOp):
+        x, y = op.offset
+        return Rect(x, y, x + text_width(op.text), y + 1).intersection(clip)
+    elif isinstance(op, BorderOp):
+        lm, rm, tm, bm = op.margins
+        return Rect(clip.x1 + lm, clip.y1 + tm, clip.x2 - rm, clip.y2 - bm)
+    return clip
+
@@ -0,0 +1,322 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Byte-minimal encoding of frame updates as ANSI output.
+
+The encoder finds the spans of cells that changed between two frames and
+emits them, choosing the cheapest way of moving the cursor to each span:
+absolute positioning, relative moves, carriage return and line feed or
+simply writing the unchanged characters in between again. The current
+attributes are tracked so that only the attributes that change are sent.
+"""
+
+from collections import namedtuple
+
+from . import ansi
+from .color import to_16
+from .color import to_256
+from .diff import apply_scroll
+from .diff import find_scroll
+from .image import BG_SHIFT
+from .image import CONTINUATION_CODE
+from .image import FG_SHIFT
+from .image import TextAttributes
+from .image import TextImage
+from .image import TextImageView
+from .width import CONTINUATION
+
+# Cells x1 to x2 (exclusive) of row y
+Span = namedtuple('Span', ['y', 'x1', 'x2'])
+
+
+def changed_spans(old: TextImage, new: TextImage, sources: list=None) -> list:
+    """
+    Find the spans of cells that differ between two images
+
+    :param old:
+        The previous image or None if nothing is known about it
+    :param new:
+        The next image
+    :param sources:
+        Optional list with the row of the old image that each row of the
+        new image should be compared with or None for rows that have to be
+        written in full (as after a scroll operation)
+    :returns:
+        A list of spans, ordered by row and column. Spans never start or
+        end in the middle of a wide character.
+    """
+    width, height = new.size
+    if old is None or old.size != new.size:
+        return [Span(y, 0, width) for y in range(height) if width]
+    if sources is None:
+        sources = range(height)
+    old_hashes = old.row_hashes()
+    new_hashes = new.row_hashes()
+    old_text = old._text
+    old_attributes = old._attributes
+    new_text = new._text
+    new_attributes = new._attributes
+    spans = []
+    for y, src in enumerate(sources):
+        if src is None:
+            spans.append(Span(y, 0, width))
+            continue
+        if old_hashes[src] == new_hashes[y]:
+            continue
+        old_offset = src * width
+        new_offset = y * width
+        start = None
+        for x in range(width):
+            same = (
+                old_text[old_offset + x] == new_text[new_offset + x]
+                and old_attributes[old_offset + x]
+                == new_attributes[new_offset + x])
+            if not same and start is None:
+                start = x
+            elif same and start is not None:
+                spans.append(_whole_chars(new, y, start, x))
+                start = None
+        if start is not None:
+            spans.append(_whole_chars(new, y, start, width))
+    return spans
+
+
+def _whole_chars(image: TextImage, y: int, x1: int, x2: int) -> Span:
+    """
+    Extend a span so that it covers both halves of wide characters
+    """
+    text_buffer = image._text
+    offset = y * image.width
+    if x1 > 0 and text_buffer[offset + x1] == CONTINUATION_CODE:
+        x1 -= 1
+    if x2 < image.width and text_buffer[offset + x2] == CONTINUATION_CODE:
+        x2 += 1
+    return Span(y, x1, x2)
+
+
+class OutputEncoder:
+    """
+    Encoder of frame updates for a terminal in raw mode
+
+    The encoder remembers the cursor position and attributes the terminal
+    is left with, so consecutive frames must be encoded by the same encoder
+    and sent to the same terminal. The terminal must not translate line
+    feeds to carriage return and line feed (OPOST must be off).
+    """
+
+    def __init__(self, colors: int=None):
+        """
+        Initialize a new encoder
+
+        :param colors:
+            Number of colors of the terminal. Colors it cannot show are
+            replaced by the nearest color of the 256-color palette or of
+            the 16 ANSI colors. By default colors are sent as they are.
+        """
+        if colors is None:
+            self._attributes = None
+        else:
+            self._attributes = _ColorCache(colors)
+        self.frames = 0
+        self.total_bytes = 0
+        self.last_frame_bytes = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the cursor position and attributes of the terminal
+        """
+        self.cursor = None
+        self.pa = None
+
+    @property
+    def bytes_per_frame(self) -> float:
+        """
+        Average number of bytes of each encoded frame
+        """
+        return self.total_bytes / self.frames if self.frames else 0.0
+
+    def encode(self, new: TextImage, old: TextImage=None) -> bytes:
+        """
+        Encode the update of the terminal from one frame to the next
+
+        :param new:
+            The frame to show
+        :param old:
+            The frame currently on screen or None to redraw everything
+        :returns:
+            Bytes to write to the terminal
+
+        Views are copied once, their buffers are rebuilt on each access.
+        """
+        if isinstance(new, TextImageView):
+            new = new.copy()
+        if isinstance(old, TextImageView):
+            old = old.copy()
+        out = []
+        sources = None
+        if old is not None and old.size == new.size:
+            scroll = find_scroll(old.row_hashes(), new.row_hashes())
+            if scroll is not None:
+                out.append(ansi.perform_scroll(scroll))
+                # DECSTBM homes the cursor
+                self.cursor = (0, 0)
+                sources = apply_scroll(list(range(new.size.height)), scroll)
+        else:
+            old = None
+        for span in changed_spans(old, new, sources):
+            out.append(self._move(new, span.x1, span.y))
+            out.append(self._write(new, span))
+        data = ''.join(out).encode('UTF-8')
+        self.frames += 1
+        self.last_frame_bytes = len(data)
+        self.total_bytes += len(data)
+        return data
+
+    def encode_frame(self, new: TextImage, old: TextImage=None) -> bytes:
+        """
+        Encode a frame for a terminal that may not show *old*
+
+        If *old* is None or has another size, the terminal may show
+        anything: the attributes are reset, the screen is cleared and the
+        whole frame is drawn from scratch. Otherwise this is encode().
+        """
+        if old is None or old.size != new.size:
+            self.reset()
+            return (ansi.RESET_ATTRIBUTES + ansi.CLEAR_SCREEN).encode(
+                'UTF-8') + self.encode(new)
+        return self.encode(new, old)
+
+    def _move(self, image: TextImage, x: int, y: int) -> str:
+        """
+        Get the cheapest sequence that moves the cursor to (*x*, *y*)
+        """
+        cursor = self.cursor
+        self.cursor = (x, y)
+        if cursor is None:
+            return ansi.cursor_position(x, y)
+        cx, cy = cursor
+        if (cx, cy) == (x, y):
+            return ''
+        # Vertical moves keep the column, line feeds don't scroll here
+        if y > cy:
+            vertical = min('\n' * (y - cy), ansi.cursor_down(y - cy),
+                           key=len)
+        elif y < cy:
+            vertical = ansi.cursor_up(cy - y)
+        else:
+            vertical = ''
+        horizontal = [ansi.cursor_column(x)]
+        if x > cx:
+            horizontal.append(ansi.cursor_forward(x - cx))
+            horizontal.append(self._rewrite(image, y, cx, x))
+        elif x < cx:
+            horizontal.append('\b' * (cx - x))
+            horizontal.append(ansi.cursor_backward(cx - x))
+        else:
+            horizontal.append('')
+        if x == 0:
+            horizontal.append('\r')
+        else:
+            horizontal.append('\r' + min(
+                ansi.cursor_forward(x), self._rewrite(image, y, 0, x),
+                key=_cost))
+        return min(vertical + min(horizontal, key=_cost),
+                   ansi.cursor_position(x, y), key=_cost)
+
+    def _rewrite(self, image: TextImage, y: int, x1: int, x2: int) -> str:
+        """
+        Get the text of cells already on screen, to move the cursor over them
+
+        Returns a string that is never chosen if rewriting is not possible
+        because the attributes differ or a wide character is in the way.
+        """
+        offset = y * image.width
+        if (image._text[offset + x1] == CONTINUATION_CODE
+                or x2 < image.width
+                and image._text[offset + x2] == CONTINUATION_CODE):
+            return _IMPOSSIBLE
+        pa = self.pa
+        attributes = image._attributes
+        for x in range(x1, x2):
+            if attributes[offset + x] != pa:
+                return _IMPOSSIBLE
+        text = image.buffer_text(offset + x1, offset + x2)
+        return text.replace(CONTINUATION, '')
+
+    def _write(self, image: TextImage, span: Span) -> str:
+        """
+        Get the text of the span, with all the required attribute changes
+        """
+        out = []
+        offset = span.y * image.width
+        text_buffer = image._text
+        attributes = image._attributes
+        for index in range(offset + span.x1, offset + span.x2):
+            c = text_buffer[index]
+            if c == CONTINUATION_CODE:
+                continue
+            pa = attributes[index]
+            if pa != self.pa:
+                out.append(self._select_attributes(pa))
+                self.pa = pa
+            out.append(chr(c))
+        if span.x2 >= image.width:
+            # The terminal may be waiting to wrap to the next row
+            self.cursor = None
+        else:
+            self.cursor = (span.x2, span.y)
+        return ''.join(out)
+
+    def _select_attributes(self, pa: int) -> str:
+        old_pa = self.pa
+        attributes = self._attributes
+        if attributes is not None:
+            pa = attributes[pa]
+            if old_pa is not None:
+                old_pa = attributes[old_pa]
+        return ansi.select_attributes(pa, old_pa)
+
+
+class _ColorCache(dict):
+    """
+    Mapping from packed attributes to the ones a terminal can show
+    """
+
+    def __init__(self, colors: int):
+        self._to_color = to_256 if colors >= 256 else to_16
+
+    def __missing__(self, pa: int) -> int:
+        fg, bg, style = TextAttributes.unpack(pa)
+        result = self[pa] = ((self._to_color(fg) << FG_SHIFT)
+                             | (self._to_color(bg) << BG_SHIFT) | style)
+        return result
+
+
+# Stand-in for moves that are not possible, longer than any real move
+_IMPOSSIBLE = '\x00' * 1000
+
+
+def _cost(sequence: str) -> int:
+    """
+    Get the number of bytes needed to send *sequence*
+    """
+    if sequence.isascii():
+        return len(sequence)
+    return len(sequence.encode('UTF-8'))
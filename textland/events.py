@@ -23,9 +23,47 @@ Event = namedtuple('Event', ['kind', 'data'])
 
 # Data for Event.data
 KeyboardData = namedtuple('KeyboardData', ['key'])
-MouseData = namedtuple('MouseData', ['x', 'y', 'buttons'])
+MouseData = namedtuple('MouseData', ['x', 'y', 'buttons', 'action'],
+                       defaults=(None,))
 
 # Constants for Event.kind
 EVENT_KEYBOARD = "keyboard"
 EVENT_MOUSE = "mouse"
 EVENT_RESIZE = "resize"
+
+# Constants for MouseData.buttons, a bit mask of the buttons that were
+# pressed or released or, for motion, that are held down
+BUTTON_LEFT = 1 << 0
+BUTTON_MIDDLE = 1 << 1
+BUTTON_RIGHT = 1 << 2
+WHEEL_UP = 1 << 3
+WHEEL_DOWN = 1 << 4
+
+# Constants for MouseData.action
+MOUSE_PRESS = "press"
+MOUSE_RELEASE = "release"
+MOUSE_MOTION = "motion"
+
+
+def is_motion(event: Event) -> bool:
+    """
+    Check if the event is a mouse motion event
+    """
+    return event.kind == EVENT_MOUSE and event.data.action == MOUSE_MOTION
+
+
+def coalesce_motion(events: list) -> list:
+    """
+    Drop motion events immediately followed by another motion event
+
+    The buttons held down must be the same, so that the last position of
+    each drag is kept. Nothing else is reordered or dropped.
+    """
+    result = []
+    for event in events:
+        if (result and is_motion(event) and is_motion(result[-1])
+                and result[-1].data.buttons == event.data.buttons):
+            result[-1] = event
+        else:
+            result.append(event)
+    return result
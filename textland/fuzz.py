@@ -0,0 +1,286 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Randomized testing of applications.
+
+fuzz() runs many sessions of an application, each fed a random stream of
+keys, resizes (including degenerate sizes such as 0x0 and 1x1) and mouse
+events, in a pool of processes. A session fails when the application
+raises an exception, takes too long to handle an event or returns an
+image that doesn't have the size of the display. Failing sessions are
+shrunk to a minimal list of events that still fails the same way.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from time import monotonic
+import traceback
+
+from . import keys
+from .abc import IApplication
+from .bits import Size
+from .display import TestDisplay
+from .events import BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT
+from .events import EVENT_KEYBOARD, EVENT_MOUSE, EVENT_RESIZE
+from .events import Event, KeyboardData, MouseData
+from .events import MOUSE_MOTION, MOUSE_PRESS, MOUSE_RELEASE
+from .events import WHEEL_DOWN, WHEEL_UP
+from .image import TextImage
+
+# Constants for FuzzFailure.kind
+FAILURE_EXCEPTION = "exception"
+FAILURE_LATENCY = "latency"
+FAILURE_SIZE = "size"
+
+_KEYS = [keys.KEY_UP, keys.KEY_DOWN, keys.KEY_LEFT, keys.KEY_RIGHT,
+         keys.KEY_ENTER, keys.KEY_SPACE, '\x1b', '\t', '\x7f', 'é', '日']
+_SIZES = [Size(0, 0), Size(1, 1), Size(0, 1), Size(1, 0), Size(2, 1),
+          Size(1, 25), Size(80, 1), Size(80, 25), Size(255, 3)]
+_BUTTONS = [BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT]
+
+
+class FuzzFailure:
+    """
+    A session in which the application misbehaved
+
+    *size* is the initial size of the display and *events* the events that
+    followed, after shrinking. run_session() reproduces the failure.
+    """
+
+    def __init__(self, seed: int, kind: str, message: str, size: Size,
+                 events: list, original_length: int):
+        self.seed = seed
+        self.kind = kind
+        self.message = message
+        self.size = size
+        self.events = events
+        self.original_length = original_length
+
+    def __repr__(self):
+        return "<FuzzFailure seed:{} kind:{} events:{}/{}>".format(
+            self.seed, self.kind, len(self.events), self.original_length)
+
+    def __str__(self):
+        lines = ["seed {}: {} after {} events (shrunk from {})".format(
+            self.seed, self.kind, len(self.events), self.original_length)]
+        lines.append("initial size: {}".format(self.size))
+        lines.extend("  {}".format(event) for event in self.events)
+        lines.append(self.message.rstrip())
+        return '\n'.join(lines)
+
+
+def random_events(rng: Random, count: int, size: Size) -> list:
+    """
+    Generate a random stream of events
+
+    :param rng:
+        The random number generator to use
+    :param count:
+        Number of events to generate
+    :param size:
+        Initial size of the display, mouse events mostly land inside of
+        the display but sometimes just outside of it
+    """
+    events = []
+    buttons = 0
+    for _ in range(count):
+        choice = rng.random()
+        if choice < 0.1:
+            size = rng.choice(_SIZES) if rng.random() < 0.5 else Size(
+                rng.randint(0, 200), rng.randint(0, 60))
+            events.append(Event(EVENT_RESIZE, size))
+        elif choice < 0.35:
+            x = rng.randint(-1, size.width)
+            y = rng.randint(-1, size.height)
+            if buttons and rng.random() < 0.6:
+                data = MouseData(x, y, buttons, MOUSE_MOTION)
+                if rng.random() < 0.3:
+                    data = MouseData(x, y, buttons, MOUSE_RELEASE)
+                    buttons = 0
+            elif rng.random() < 0.2:
+                data = MouseData(
+                    x, y, rng.choice([WHEEL_UP, WHEEL_DOWN]), MOUSE_PRESS)
+            else:
+                buttons = rng.choice(_BUTTONS)
+                data = MouseData(x, y, buttons, MOUSE_PRESS)
+            events.append(Event(EVENT_MOUSE, data))
+        else:
+            if rng.random() < 0.3:
+                key = rng.choice(_KEYS)
+            else:
+                key = chr(rng.randint(32, 126))
+            events.append(Event(EVENT_KEYBOARD, KeyboardData(key)))
+    return events
+
+
+class _FuzzDisplay(TestDisplay):
+    """
+    Test display that checks frames and times the application
+    """
+
+    def __init__(self, size: Size, max_latency: float):
+        super().__init__(size)
+        self.max_latency = max_latency
+        self.failure = None
+
+    def display_image(self, image: TextImage) -> None:
+        if not isinstance(image, TextImage) or image.size != self.size:
+            self.failure = (
+                FAILURE_SIZE, "got {!r} for a display of {}".format(
+                    getattr(image, 'size', image), self.size))
+            raise StopIteration
+
+    def wait_for_event(self) -> Event:
+        event = super().wait_for_event()
+        if event.kind == EVENT_RESIZE:
+            self.size = event.data
+        return event
+
+
+class _TimedApplication(IApplication):
+
+    def __init__(self, app: IApplication, display: _FuzzDisplay):
+        self.app = app
+        self.display = display
+
+    def consume_event(self, event: Event) -> TextImage:
+        start = monotonic()
+        try:
+            image = self.app.consume_event(event)
+        except StopIteration:
+            raise
+        except Exception:
+            self.display.failure = (
+                FAILURE_EXCEPTION, traceback.format_exc())
+            raise StopIteration
+        latency = monotonic() - start
+        if latency > self.display.max_latency:
+            self.display.failure = (
+                FAILURE_LATENCY, "{!r} took {:.3f}s".format(event, latency))
+            raise StopIteration
+        return image
+
+
+def run_session(app: IApplication, size: Size, events: list,
+                max_latency: float=0.1) -> tuple:
+    """
+    Feed events to an application and check how it handles them
+
+    :param app:
+        The application, freshly created
+    :param size:
+        Initial size of the display
+    :param events:
+        Events given to the application after the initial resize event
+    :param max_latency:
+        Maximum time, in seconds, that handling one event may take
+    :returns:
+        None if the application behaved, a (kind, message) tuple otherwise
+    """
+    display = _FuzzDisplay(size, max_latency)
+    for event in events:
+        display.inject_event(event)
+    try:
+        display.run(_TimedApplication(app, display))
+    except StopIteration:
+        pass  # Raised by display_image(), outside of the event loop
+    return display.failure
+
+
+def _shrink(app_factory, size: Size, events: list, kind: str,
+            max_latency: float) -> tuple:
+    """
+    Remove as many events as possible while still failing the same way
+
+    :returns:
+        (events, message) of the smallest case found
+    """
+    message = None
+    chunk = len(events) // 2
+    while chunk >= 1:
+        start = 0
+        while start < len(events):
+            candidate = events[:start] + events[start + chunk:]
+            failure = run_session(app_factory(), size, candidate, max_latency)
+            if failure is not None and failure[0] == kind:
+                events = candidate
+                message = failure[1]
+            else:
+                start += chunk
+        chunk //= 2
+    return events, message
+
+
+def _fuzz_session(app_factory, seed: int, count: int, max_latency: float,
+                  shrink: bool) -> FuzzFailure:
+    rng = Random(seed)
+    size = rng.choice(_SIZES)
+    events = random_events(rng, count, size)
+    failure = run_session(app_factory(), size, events, max_latency)
+    if failure is None:
+        return None
+    kind, message = failure
+    original_length = len(events)
+    if shrink:
+        events, shrunk_message = _shrink(
+            app_factory, size, events, kind, max_latency)
+        if shrunk_message is not None:
+            message = shrunk_message
+    return FuzzFailure(seed, kind, message, size, events, original_length)
+
+
+def fuzz(app_factory, sessions: int=100, events: int=200, seed: int=0,
+         max_latency: float=0.1, shrink: bool=True,
+         executor=None) -> list:
+    """
+    Run random sessions of an application in parallel
+
+    :param app_factory:
+        A picklable callable, for example the application class, that
+        creates a new application for each session
+    :param sessions:
+        Number of sessions to run
+    :param events:
+        Number of random events in each session
+    :param seed:
+        Seed of the first session, session *n* uses seed + n so that any
+        session can be run again on its own
+    :param max_latency:
+        Maximum time, in seconds, that handling one event may take
+    :param shrink:
+        If True, failing sessions are shrunk to a minimal list of events
+    :param executor:
+        A concurrent.futures executor to use. By default a new
+        ProcessPoolExecutor is created and shut down when done.
+    :returns:
+        A list of FuzzFailure, one for each failing session
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    try:
+        futures = [
+            executor.submit(_fuzz_session, app_factory, seed + n, events,
+                            max_latency, shrink)
+            for n in range(sessions)]
+        return [failure for failure in (future.result() for future in futures)
+                if failure is not None]
+    finally:
+        if own_executor:
+            executor.shutdown()
@@ -0,0 +1,120 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spatial index of clickable regions.
+"""
+
+from .bits import Rect
+
+
+class HitTestIndex:
+    """
+    Index of rectangles, finding the ones under a point in constant time
+
+    The screen is divided into square buckets of cells. Each rectangle is
+    listed in all the buckets it overlaps so a lookup only looks at the few
+    rectangles listed in the bucket of the point. Rectangles added later
+    are on top of the ones added before, like widgets painted later.
+    """
+
+    def __init__(self, bucket_size: int=8):
+        """
+        Initialize a new, empty index
+
+        :param bucket_size:
+            Width and height of the buckets, in cells
+        """
+        self.bucket_size = bucket_size
+        # (column, row) of bucket -> list of (order, rect, key)
+        self._buckets = {}
+        # key -> (order, rect)
+        self._entries = {}
+        self._order = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def _bucket_keys(self, rect: Rect):
+        size = self.bucket_size
+        for row in range(rect.y1 // size, (rect.y2 - 1) // size + 1):
+            for column in range(rect.x1 // size, (rect.x2 - 1) // size + 1):
+                yield column, row
+
+    def add(self, rect: Rect, key) -> None:
+        """
+        Add a rectangle, identified by *key*, on top of all the others
+
+        Adding a key that is already in the index replaces its rectangle.
+        """
+        if key in self._entries:
+            self.remove(key)
+        if rect.is_empty():
+            return
+        self._order += 1
+        entry = (self._order, rect, key)
+        self._entries[key] = entry
+        for bucket_key in self._bucket_keys(rect):
+            self._buckets.setdefault(bucket_key, []).append(entry)
+
+    def remove(self, key) -> None:
+        """
+        Remove the rectangle identified by *key*
+
+        :raises KeyError:
+            If there is no such key
+        """
+        entry = self._entries.pop(key)
+        for bucket_key in self._bucket_keys(entry[1]):
+            bucket = self._buckets[bucket_key]
+            bucket.remove(entry)
+            if not bucket:
+                del self._buckets[bucket_key]
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._entries.clear()
+
+    def get_rect(self, key) -> Rect:
+        return self._entries[key][1]
+
+    def hit(self, x: int, y: int):
+        """
+        Get the key of the topmost rectangle under (*x*, *y*)
+
+        :returns:
+            The key or None if there is no rectangle there
+        """
+        size = self.bucket_size
+        bucket = self._buckets.get((x // size, y // size), ())
+        for _, rect, key in reversed(bucket):
+            if rect.contains_point(x, y):
+                return key
+        return None
+
+    def hits(self, x: int, y: int) -> list:
+        """
+        Get the keys of all the rectangles under (*x*, *y*), topmost first
+        """
+        size = self.bucket_size
+        bucket = self._buckets.get((x // size, y // size), ())
+        return [key for _, rect, key in reversed(bucket)
+                if rect.contains_point(x, y)]
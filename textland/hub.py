@@ -0,0 +1,378 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Many terminals served by one process.
+
+A DisplayHub multiplexes any number of sessions (terminals, sockets or
+pipes talking to ANSI terminals) in one event loop, without curses. Each
+session looks at an IView. Sessions looking at the same view with the same
+size share one rendered image, but each session has its own input parser,
+encoder and last frame, so it is only sent the changes it hasn't seen yet.
+A session whose output isn't drained fast enough skips frames instead of
+holding up the others.
+"""
+
+from time import monotonic
+import os
+import selectors
+try:
+    import termios
+except ImportError:
+    termios = None
+
+from . import ansi
+from .abc import IView
+from .ansi import InputParser
+from .bits import Size
+from .encoder import OutputEncoder
+from .events import EVENT_RESIZE
+from .events import Event
+from .image import TextImage
+from .resize import terminal_size
+
+# Time, in seconds, after which incomplete escape sequences are given up on
+_FLUSH_DELAY = 0.05
+
+
+class Session:
+    """
+    One terminal connected to a DisplayHub
+
+    Sessions are created with DisplayHub.add_session(). The hub handler can
+    change the *view* with show() and report size changes (for example
+    from telnet NAWS or SSH window-change requests) with resize().
+    """
+
+    def __init__(self, hub: 'DisplayHub', fd_in: int, fd_out: int,
+                 view: IView, size: Size, mouse: bool):
+        self.hub = hub
+        self.fd_in = fd_in
+        self.fd_out = fd_out
+        self.view = view
+        self.size = size
+        self.mouse = mouse
+        self.parser = InputParser()
+        self.encoder = OutputEncoder()
+        self.last_image = None
+        self.closed = False
+        self._output = bytearray()
+        self._input_time = None
+        self._saved_attrs = None
+        self._saved_blocking = None
+
+    def show(self, view: IView) -> None:
+        """
+        Make the session look at another view
+        """
+        self.view = view
+
+    def resize(self, size: Size) -> None:
+        """
+        Note that the terminal of the session has a new size
+
+        The hub handler gets an EVENT_RESIZE event for the session.
+        """
+        if size != self.size:
+            self.size = size
+            self.hub._dispatch(self, Event(EVENT_RESIZE, size))
+
+    def close(self) -> None:
+        """
+        Restore the terminal and remove the session from the hub
+
+        The file descriptors are left open, they belong to the caller.
+        """
+        self.hub._remove(self)
+
+    @property
+    def is_writing(self) -> bool:
+        """
+        Check if the session still has output waiting to be written
+        """
+        return bool(self._output)
+
+    def _init_terminal(self) -> None:
+        fds = {self.fd_in, self.fd_out}
+        self._saved_blocking = {fd: os.get_blocking(fd) for fd in fds}
+        for fd in fds:
+            os.set_blocking(fd, False)
+        if termios is not None and os.isatty(self.fd_out):
+            self._saved_attrs = ansi.enter_raw_mode(self.fd_in, self.fd_out)
+        self._output += ansi.setup_sequences(self.mouse).encode('UTF-8')
+
+    def _fini_terminal(self) -> None:
+        # Best effort, the session may be gone or not reading any more
+        try:
+            os.write(self.fd_out,
+                     ansi.teardown_sequences(self.mouse).encode('UTF-8'))
+        except OSError:
+            pass
+        if self._saved_attrs is not None:
+            try:
+                ansi.leave_raw_mode(self.fd_in, self.fd_out,
+                                    self._saved_attrs, drain=False)
+            except termios.error:
+                pass
+            self._saved_attrs = None
+        if self._saved_blocking is not None:
+            for fd, blocking in self._saved_blocking.items():
+                try:
+                    os.set_blocking(fd, blocking)
+                except OSError:
+                    pass  # Already closed by the caller
+            self._saved_blocking = None
+
+    def _send(self, image: TextImage) -> None:
+        """
+        Queue the changes from the last frame sent to *image*
+        """
+        if self.last_image is image:
+            return
+        self._output += self.encoder.encode_frame(image, self.last_image)
+        # Rendered images are never modified, so they can be kept as they are
+        self.last_image = image
+
+
+class DisplayHub:
+    """
+    Event loop serving many sessions at once
+
+    The *handler* is called as handler(session, event) for every input
+    event of every session, and for resizes. It can change the state of
+    views, call invalidate() for the views that need to be rendered again,
+    switch the session to another view or raise StopIteration to close
+    the session.
+
+    Views are only rendered by the hub, once per size in use, when they are
+    invalidated or looked at with a new size. IView.render() must return a
+    new image each time, the hub keeps the images it was given as the
+    last frames of the sessions.
+    """
+
+    def __init__(self, handler=None):
+        """
+        Initialize a new hub
+
+        :param handler:
+            Callable getting all the events of all the sessions, by default
+            events are ignored
+        """
+        self.handler = handler
+        self.sessions = []
+        self.frames_rendered = 0
+        self._selector = selectors.DefaultSelector()
+        # Rendered images of each view, by size
+        self._frames = {}
+        self._stopped = False
+
+    def add_session(self, fd_in: int, fd_out: int=None, view: IView=None,
+                    size: Size=None, mouse: bool=False) -> Session:
+        """
+        Start serving a terminal
+
+        :param fd_in:
+            File descriptor of the terminal input, for example a socket or
+            a terminal. With a pty, this is the slave side, the one a
+            program running in the terminal would use; the master side
+            belongs to the terminal emulator or to sshd. The descriptors
+            are made non-blocking while the session lasts.
+        :param fd_out:
+            File descriptor of the terminal output, *fd_in* by default
+        :param view:
+            The view to show
+        :param size:
+            Size of the terminal, by default the size of *fd_out* if it is
+            a terminal, 80x24 otherwise
+        :param mouse:
+            If True, mouse buttons and drags are reported as EVENT_MOUSE
+        :returns:
+            The new session
+        """
+        if fd_out is None:
+            fd_out = fd_in
+        if size is None:
+            size = (terminal_size(fd_out) if os.isatty(fd_out)
+                    else Size(80, 24))
+        session = Session(self, fd_in, fd_out, view, size, mouse)
+        session._init_terminal()
+        self.sessions.append(session)
+        self._update_registration(session)
+        return session
+
+    def invalidate(self, view: IView) -> None:
+        """
+        Note that a view has changed and has to be rendered again
+        """
+        self._frames.pop(view, None)
+
+    def stop(self) -> None:
+        """
+        Make run() return after the current iteration
+        """
+        self._stopped = True
+
+    def close(self) -> None:
+        """
+        Close all the sessions and release the resources of the hub
+        """
+        for session in list(self.sessions):
+            self._remove(session)
+        self._selector.close()
+
+    def run(self) -> None:
+        """
+        Serve the sessions until all of them are closed or stop() is called
+        """
+        self._stopped = False
+        while self.sessions and not self._stopped:
+            self.run_once()
+
+    def run_once(self, timeout: float=None) -> None:
+        """
+        Wait for input or output and handle it, then send new frames
+
+        :param timeout:
+            Maximum time to wait, in seconds, or None to wait until
+            something happens
+        """
+        self._send_frames()
+        now = monotonic()
+        for session in self.sessions:
+            if session._input_time is not None:
+                delay = max(0.0, session._input_time + _FLUSH_DELAY - now)
+                timeout = delay if timeout is None else min(timeout, delay)
+        for key, mask in self._selector.select(timeout):
+            session = key.data
+            if session.closed:
+                continue
+            if mask & selectors.EVENT_WRITE and session.fd_out == key.fd:
+                self._write(session)
+            if mask & selectors.EVENT_READ and session.fd_in == key.fd:
+                self._read(session)
+        now = monotonic()
+        for session in list(self.sessions):
+            if (session._input_time is not None
+                    and now - session._input_time >= _FLUSH_DELAY):
+                session._input_time = None
+                self._dispatch_all(session, session.parser.flush())
+        self._send_frames()
+
+    def _read(self, session: Session) -> None:
+        try:
+            data = os.read(session.fd_in, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''  # For example EIO from a pty that was hung up
+        if not data:
+            self._remove(session)
+            return
+        events = session.parser.feed(data)
+        session._input_time = (
+            monotonic() if session.parser.has_pending_input else None)
+        self._dispatch_all(session, events)
+
+    def _dispatch_all(self, session: Session, events: list) -> None:
+        for event in events:
+            if session.closed:
+                break
+            self._dispatch(session, event)
+
+    def _dispatch(self, session: Session, event: Event) -> None:
+        if self.handler is None:
+            return
+        try:
+            self.handler(session, event)
+        except StopIteration:
+            self._remove(session)
+
+    def _frame(self, view: IView, size: Size) -> TextImage:
+        """
+        Get the image of a view, rendering it if necessary
+        """
+        frames = self._frames.setdefault(view, {})
+        image = frames.get(size)
+        if image is None:
+            image = frames[size] = view.render(size)
+            self.frames_rendered += 1
+        return image
+
+    def _send_frames(self) -> None:
+        in_use = set()
+        for session in list(self.sessions):
+            if session.view is None:
+                continue
+            in_use.add((session.view, session.size))
+            # Sessions still writing get the latest frame once they are done
+            if not session._output:
+                session._send(self._frame(session.view, session.size))
+                self._write(session)
+        # Forget the images of sizes nobody looks at any more
+        for view, frames in list(self._frames.items()):
+            for size in list(frames):
+                if (view, size) not in in_use:
+                    del frames[size]
+            if not frames:
+                del self._frames[view]
+
+    def _write(self, session: Session) -> None:
+        output = session._output
+        try:
+            while output:
+                del output[:os.write(session.fd_out, output)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._remove(session)
+            return
+        self._update_registration(session)
+
+    def _update_registration(self, session: Session) -> None:
+        """
+        Wait for input and, while there is output left, for writability
+        """
+        wanted = {session.fd_in: selectors.EVENT_READ}
+        if session._output:
+            wanted[session.fd_out] = (
+                wanted.get(session.fd_out, 0) | selectors.EVENT_WRITE)
+        for fd, events in wanted.items():
+            try:
+                key = self._selector.get_key(fd)
+            except KeyError:
+                self._selector.register(fd, events, session)
+            else:
+                if key.events != events:
+                    self._selector.modify(fd, events, session)
+        if session.fd_out not in wanted:
+            try:
+                self._selector.unregister(session.fd_out)
+            except KeyError:
+                pass
+
+    def _remove(self, session: Session) -> None:
+        if session.closed:
+            return
+        session.closed = True
+        self.sessions.remove(session)
+        for fd in {session.fd_in, session.fd_out}:
+            try:
+                self._selector.unregister(fd)
+            except (KeyError, ValueError):
+                pass
+        session._fini_terminal()
@@ -18,8 +18,11 @@
 # along with Textland.  If not, see <http://www.gnu.org/licenses/>.
 
 from array import array
+import sys
 
-from .bits import Cell, Size
+from .bits import Cell, Rect, Size
+from .color import COLOR_MASK
+from .width import CONTINUATION, REPLACEMENT_CHARACTER, char_width
 
 # ANSI color index
 (
@@ -33,23 +36,256 @@ NORMAL = 0  # Normal (default style)
 REVERSE = 1 << 0  # Reverse background and foreground colors
 UNDERLINE = 1 << 1  # Underline mode
 
+# Layout of packed attributes (see TextAttributes.packed)
+STYLE_MASK = 0xff
+BG_SHIFT = 8
+FG_SHIFT = 33
+
+# Encodings of the text buffer: one byte per cell while all the characters
+# fit in Latin-1, one code point (4 bytes) per cell otherwise.
+_LATIN_1 = 'latin-1'
+_UCS4 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+_UCS4_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+# Array of characters, 'u' is deprecated in favour of 'w' since Python 3.13
+_CHARACTER_TYPECODE = 'w' if sys.version_info >= (3, 13) else 'u'
+
+# CONTINUATION as stored in the text buffer
+CONTINUATION_CODE = ord(CONTINUATION)
+
+
+# Control characters (C0, DEL and C1) would be acted on by terminals, they
+# are stored as '?' instead. CONTINUATION can't be part of text either.
+_CONTROL_REPLACEMENTS = dict.fromkeys(
+    [*range(0x20), *range(0x7f, 0xa0)], '?')
+_TEXT_REPLACEMENTS = dict(_CONTROL_REPLACEMENTS)
+_TEXT_REPLACEMENTS[CONTINUATION_CODE] = REPLACEMENT_CHARACTER
+
+
+def printable_text(text: str) -> str:
+    """
+    Get *text* as images store it, with control characters replaced
+
+    Control characters, such as ESC, TAB or NUL, would move the cursor or
+    start escape sequences when written to a terminal. Images store them
+    as '?', CONTINUATION is stored as REPLACEMENT_CHARACTER.
+
+    >>> printable_text('a\\tb\\x1b[2Jc\\0d\\x7f\\x9b')
+    'a?b?[2Jc?d??'
+    """
+    if text.isprintable():
+        return text
+    return text.translate(_TEXT_REPLACEMENTS)
+
+
+def _attribute_run(pa: int, length: int) -> array:
+    """
+    Create an attribute buffer with *length* copies of attribute *pa*
+    """
+    return array('Q', [pa]) * length  # Unsigned 64-bit integer
+
 
 class TextImage:
     """
     A rectangular, mutable text image.
 
     The image supports NORMAL, REVERSE and UNDERLINE as per-cell attributes,
-    the 8 colors described in the ANSI standard and the BOLD video attribute
-    to render the foreground colors as bright (aka light or intensified).
+    the 16 colors described in the ANSI standard, the 256-color palette and
+    24-bit colors (see textland.color) for both foreground and background.
+
+    Wide characters occupy two cells. The character itself is stored in the
+    left cell and the right cell holds the CONTINUATION marker. Overwriting
+    either half of a wide character blanks the other half.
+
+    The text of the cells is stored as code points, in a bytearray as long
+    as all the characters fit in Latin-1, replaced by an array of 32-bit
+    code points the first time a character that doesn't fit is stored. Use
+    buffer_text() to read it as a string. The text_buffer attribute still
+    gives array-like access to the characters, see TextBuffer.
+    The packed attributes of the cells are stored in attribute_buffer.
     """
 
     def __init__(self, size: Size):
         self.size = size
         self.width = self.size.width
-        self.text_buffer = array('u')
-        self.text_buffer.extend(' ' * size.width * size.height)
-        self.attribute_buffer = array('H')  # Unsigned short
-        self.attribute_buffer.extend([0] * size.width * size.height)
+        self._codec = _LATIN_1
+        self._text = bytearray(b' ') * (size.width * size.height)
+        self._attributes = _attribute_run(0, size.width * size.height)
+        # Set as soon as any wide character is stored
+        self._has_wide = False
+        # Lazily computed row hashes, None marks rows that need hashing
+        self._row_hashes = [None] * size.height
+
+    def resize(self, size: Size, keep_content: bool=False) -> None:
+        """
+        Change the size of the image, reusing the existing buffers
+
+        :param size:
+            The new size
+        :param keep_content:
+            If True, the part of the old content that fits in the new size
+            is preserved. Otherwise the whole image becomes blank.
+
+        The buffers are only grown when the new size has more cells than
+        the old one, shrinking never allocates new buffers. Images that
+        needed 4 bytes per character go back to one byte per character
+        when the content is not kept.
+        """
+        old_width, old_height = self.size
+        width, height = size
+        length = width * height
+        kept = width * min(height, old_height)
+        if not keep_content and self._codec is not _LATIN_1:
+            self._codec = _LATIN_1
+            self._text = bytearray()
+        text_buffer = self._text
+        attribute_buffer = self._attributes
+        _text_run = self._text_run
+        if not keep_content:
+            del text_buffer[length:]
+            del attribute_buffer[length:]
+            text_buffer[:] = _text_run(' ', length)
+            attribute_buffer[:] = _attribute_run(0, length)
+            self._has_wide = False
+        elif width <= old_width:
+            # Move rows towards the start, in order, then drop the tail
+            for y in range(min(height, old_height)):
+                src = y * old_width
+                dst = y * width
+                if (self._has_wide and 0 < width < old_width
+                        and text_buffer[src + width] == CONTINUATION_CODE):
+                    # Don't keep the left half of a wide character
+                    text_buffer[src + width - 1] = 0x20  # Space
+                if src != dst:
+                    text_buffer[dst:dst + width] = (
+                        text_buffer[src:src + width])
+                    attribute_buffer[dst:dst + width] = (
+                        attribute_buffer[src:src + width])
+            del text_buffer[kept:]
+            del attribute_buffer[kept:]
+        else:
+            # Grow first, then move rows towards the end, in reverse order
+            extra = max(0, length - len(text_buffer))
+            text_buffer.extend(_text_run(' ', extra))
+            attribute_buffer.extend(_attribute_run(0, extra))
+            blank_text = _text_run(' ', width - old_width)
+            blank_attributes = _attribute_run(0, width - old_width)
+            for y in reversed(range(min(height, old_height))):
+                src = y * old_width
+                dst = y * width
+                text_buffer[dst:dst + old_width] = (
+                    text_buffer[src:src + old_width])
+                attribute_buffer[dst:dst + old_width] = (
+                    attribute_buffer[src:src + old_width])
+                text_buffer[dst + old_width:dst + width] = blank_text
+                attribute_buffer[dst + old_width:dst + width] = (
+                    blank_attributes)
+            del text_buffer[kept:]
+            del attribute_buffer[kept:]
+        if len(text_buffer) < length:
+            # Rows below the old content
+            extra = length - len(text_buffer)
+            text_buffer.extend(_text_run(' ', extra))
+            attribute_buffer.extend(_attribute_run(0, extra))
+        self.size = size
+        self.width = width
+        self._row_hashes = [None] * height
+
+    def _text_run(self, c: str, length: int):
+        """
+        Create *length* copies of character *c*, encoded like the text
+        """
+        return self._encode(c) * length
+
+    def _encode(self, text: str):
+        """
+        Encode text so that it can be stored into the text buffer
+
+        The text buffer is widened first if *text* doesn't fit in Latin-1.
+        """
+        if self._codec is _LATIN_1:
+            try:
+                return text.encode(_LATIN_1)
+            except UnicodeEncodeError:
+                self._widen()
+        return array(_UCS4_TYPECODE, text.encode(_UCS4, 'surrogatepass'))
+
+    def _widen(self) -> None:
+        """
+        Switch to a text buffer that can store any character
+        """
+        self._text = array(
+            _UCS4_TYPECODE,
+            self.buffer_text().encode(_UCS4, 'surrogatepass'))
+        self._codec = _UCS4
+
+    def buffer_text(self, start: int=0, stop: int=None) -> str:
+        """
+        Decode cells *start* to *stop* (exclusive) of the text buffer
+
+        :param start:
+            Offset of the first cell, counting cells row by row
+        :param stop:
+            Offset past the last cell, the end of the buffer by default
+        :returns:
+            The characters of those cells, CONTINUATION markers included
+        """
+        return str(self._text[start:stop], self._codec, 'surrogatepass')
+
+    @property
+    def attribute_buffer(self) -> array:
+        """
+        Packed attributes of all the cells, row by row
+
+        This is the buffer of the image itself, an array of unsigned 64-bit
+        integers. Call invalidate_rows() after changing it directly.
+        """
+        return self._attributes
+
+    def attributes_used(self, rows=None) -> set:
+        """
+        Get the set of packed attributes used by some rows
+
+        :param rows:
+            Y coordinates of the rows, all the rows by default
+        """
+        width = self.width
+        attributes = self._attributes
+        if rows is None:
+            return set(attributes)
+        used = set()
+        for y in rows:
+            used.update(attributes[y * width:(y + 1) * width])
+        return used
+
+    @property
+    def text_buffer(self) -> 'TextBuffer':
+        """
+        Characters of all the cells, row by row
+
+        This used to be an array of characters (typecode 'u'). It is now a
+        TextBuffer, which behaves like one: indexing gives one-character
+        strings, slicing gives arrays of characters, tounicode() gives the
+        whole text and assigning to items or slices changes the image.
+        """
+        return TextBuffer(self)
+
+    def copy_from(self, other: 'TextImage') -> None:
+        """
+        Replace the size and content of this image with those of *other*
+
+        The buffers are reused whenever they are large enough. *other* may
+        also be a TextImageView.
+        """
+        if self._codec is other._codec:
+            self._text[:] = other._text
+        else:
+            self._text = other._text[:]
+            self._codec = other._codec
+        self._attributes[:] = other._attributes
+        self.size = other.size
+        self.width = other.width
+        self._has_wide = other._has_wide
+        self._row_hashes = list(other._row_hashes)
 
     def put(self, x: int, y: int, c: str, pa: int) -> None:
         """
@@ -60,15 +296,112 @@ class TextImage:
         :param y:
             Y coordinate
         :param c:
-            One character string
+            One character string. Control characters are stored as '?',
+            see printable_text().
         :param pa:
-            Packed attribute (up to uint16_t)
+            Packed attribute (up to uint64_t)
         """
         assert 0 <= x < self.size.width
         assert 0 <= y < self.size.height
         offset = x + y * self.width
-        self.text_buffer[offset] = c
-        self.attribute_buffer[offset] = pa
+        code = ord(c)
+        if code < 0x20 or 0x7f <= code < 0xa0:
+            code = 0x3f  # Control characters are stored as '?'
+        elif code > 0xff and self._codec is _LATIN_1:
+            self._widen()
+        if code == CONTINUATION_CODE:
+            self._has_wide = True
+            # The cell may be the left half of another wide character
+            if (x + 1 < self.width
+                    and self._text[offset + 1] == CONTINUATION_CODE):
+                self._text[offset + 1] = 0x20  # Space
+        elif self._has_wide:
+            self._split_wide(x, offset)
+        self._text[offset] = code
+        self._attributes[offset] = pa
+        self._row_hashes[y] = None
+
+    def fill_rect(self, x1: int, y1: int, x2: int, y2: int,
+                  c: str, pa: int) -> None:
+        """
+        Fill cells from (*x1*, *y1*) to (*x2*, *y2*) (exclusive)
+
+        :param c:
+            One character string, not a wide character. It is stored as
+            printable_text() returns it.
+        :param pa:
+            Packed attribute
+
+        This writes whole runs of cells at a time and is much faster than
+        calling put() for each cell.
+        """
+        assert 0 <= x1 <= x2 <= self.size.width
+        assert 0 <= y1 <= y2 <= self.size.height
+        assert char_width(c) != 2
+        length = x2 - x1
+        if length == 0 or y1 == y2:
+            return
+        c = printable_text(c)
+        text = self._text_run(c, length)
+        attributes = _attribute_run(pa, length)
+        text_buffer = self._text
+        attribute_buffer = self._attributes
+        for y in range(y1, y2):
+            offset = x1 + y * self.width
+            if self._has_wide:
+                self._split_wide_run(x1, x2, offset)
+            text_buffer[offset:offset + length] = text
+            attribute_buffer[offset:offset + length] = attributes
+        self._row_hashes[y1:y2] = [None] * (y2 - y1)
+
+    def put_text(self, x: int, y: int, text: str, pa: int) -> None:
+        """
+        Put a run of characters with attributes *pa*, starting at (*x*, *y*)
+
+        :param text:
+            Text without any wide characters that fits in the row
+        :param pa:
+            Packed attribute
+
+        This is the bulk equivalent of calling put() for each character,
+        except that CONTINUATION, which can't be part of text, is replaced
+        by REPLACEMENT_CHARACTER (see printable_text()).
+        """
+        length = len(text)
+        assert 0 <= x and x + length <= self.size.width
+        assert 0 <= y < self.size.height
+        if length == 0:
+            return
+        text = printable_text(text)
+        offset = x + y * self.width
+        encoded = self._encode(text)
+        if self._has_wide:
+            self._split_wide_run(x, x + length, offset)
+        self._text[offset:offset + length] = encoded
+        self._attributes[offset:offset + length] = _attribute_run(pa, length)
+        self._row_hashes[y] = None
+
+    def _split_wide_run(self, x1: int, x2: int, offset: int) -> None:
+        """
+        Blank halves of wide characters sticking out of a run of cells
+        """
+        text_buffer = self._text
+        if x1 > 0 and text_buffer[offset] == CONTINUATION_CODE:
+            text_buffer[offset - 1] = 0x20  # Space
+        end = offset + x2 - x1
+        if x2 < self.width and text_buffer[end] == CONTINUATION_CODE:
+            text_buffer[end] = 0x20
+
+    def _split_wide(self, x: int, offset: int) -> None:
+        """
+        Blank the other half of a wide character about to be overwritten
+        """
+        text_buffer = self._text
+        if text_buffer[offset] == CONTINUATION_CODE and x > 0:
+            text_buffer[offset - 1] = 0x20  # Space
+        if (x + 1 < self.width
+                and text_buffer[offset + 1] == CONTINUATION_CODE):
+            text_buffer[offset + 1] = 0x20
 
     def get(self, x: int, y: int) -> Cell:
         """
@@ -81,21 +414,447 @@ class TextImage:
         :returns:
             Cell(c, pa)
         """
+        assert 0 <= x < self.size.width
+        assert 0 <= y < self.size.height
         offset = x + y * self.width
-        return Cell(self.text_buffer[offset], self.attribute_buffer[offset])
+        return Cell(chr(self._text[offset]), self._attributes[offset])
+
+    def row_hash(self, y: int) -> int:
+        """
+        Get the hash of row *y*
+
+        :param y:
+            Y coordinate
+        :returns:
+            Hash of the text and attributes of the row
+
+        Hashes are computed on demand and cached until the row is modified.
+        Rows with different hashes are always different, rows with equal
+        hashes are equal (barring hash collisions). Hashes are only
+        meaningful within one process. They don't depend on how the text
+        buffer is encoded.
+        """
+        row_hash = self._row_hashes[y]
+        if row_hash is None:
+            width = self.width
+            start = y * width
+            row_hash = self._row_hashes[y] = hash((
+                self.buffer_text(start, start + width),
+                self._attributes[start:start + width].tobytes()))
+        return row_hash
+
+    def row_hashes(self) -> list:
+        """
+        Get the list of hashes of all the rows, see row_hash()
+        """
+        return [self.row_hash(y) for y in range(self.size.height)]
+
+    def invalidate_rows(self, y1: int=0, y2: int=None) -> None:
+        """
+        Forget the hashes of rows *y1* to *y2* (exclusive)
+
+        This must be called after changing the buffers of the image
+        directly, without using put().
+        """
+        if y2 is None:
+            y2 = self.size.height
+        self._row_hashes[y1:y2] = [None] * (y2 - y1)
+
+    def __eq__(self, other: 'TextImage') -> bool:
+        if not isinstance(other, (TextImage, TextImageView)):
+            return NotImplemented
+        if not (self.size == other.size
+                and self.row_hashes() == other.row_hashes()
+                and self._attributes == other._attributes):
+            return False
+        if self._codec is other._codec:
+            return self._text == other._text
+        return self.buffer_text() == other.buffer_text()
+
+    def __getstate__(self) -> dict:
+        # Row hashes only make sense in this process
+        state = dict(self.__dict__)
+        state['_row_hashes'] = [None] * self.size.height
+        return state
+
+    def copy(self) -> 'TextImage':
+        """
+        Get a new image with the same size and content
+        """
+        image = TextImage(self.size)
+        image.copy_from(self)
+        return image
+
+    def __deepcopy__(self, memo: dict) -> 'TextImage':
+        return self.copy()
+
+    def __hash__(self) -> int:
+        """
+        Hash the size and content of the image, see row_hash()
+
+        Images are mutable: an image must not be modified while it is used
+        as a dictionary key or kept in a set.
+        """
+        return hash((self.size, tuple(self.row_hashes())))
+
+    def row_text(self, y: int) -> str:
+        """
+        Get the text of row *y* as it should be displayed
+
+        :param y:
+            Y coordinate
+        :returns:
+            Text of the row, without CONTINUATION markers
+        """
+        width = self.width
+        line = self.buffer_text(y * width, (y + 1) * width)
+        if self._has_wide:
+            line = line.replace(CONTINUATION, '')
+        return line
+
+    def blit(self, source: 'TextImage', rect: Rect, x: int, y: int) -> None:
+        """
+        Copy the cells of *source* inside *rect* to (*x*, *y*) of this image
+
+        :param source:
+            Image or view to copy from, it may have a different size
+        :param rect:
+            Area of the source image to copy, it must be inside of it
+        :param x, y:
+            Position of the copy in this image, it must fit
+
+        Rows are copied with bulk slice assignments. Cells are copied as
+        they are, wide characters cut in half by the edges of *rect* are
+        not fixed.
+        """
+        width = rect.x2 - rect.x1
+        height = rect.y2 - rect.y1
+        assert 0 <= rect.x1 <= rect.x2 <= source.size.width
+        assert 0 <= rect.y1 <= rect.y2 <= source.size.height
+        assert 0 <= x and x + width <= self.size.width
+        assert 0 <= y and y + height <= self.size.height
+        if width == 0 or height == 0:
+            return
+        if isinstance(source, TextImageView):
+            # Copy straight from the buffers of the viewed image
+            rect = rect.translated(source.x, source.y)
+            source = source.image
+        if source._codec is not self._codec and self._codec is _LATIN_1:
+            self._widen()
+        same_codec = source._codec is self._codec
+        if width == source.width == self.width:
+            # Whole rows are contiguous, copy them all at once
+            rows = 1
+            width *= height
+        else:
+            rows = height
+        for row in range(rows):
+            src = rect.x1 + (rect.y1 + row) * source.width
+            dst = x + (y + row) * self.width
+            if same_codec:
+                self._text[dst:dst + width] = (
+                    source._text[src:src + width])
+            else:
+                self._text[dst:dst + width] = self._encode(
+                    source.buffer_text(src, src + width))
+            self._attributes[dst:dst + width] = (
+                source._attributes[src:src + width])
+        if source._has_wide:
+            self._has_wide = True
+        self._row_hashes[y:y + height] = [None] * height
+
+    def view(self, rect: Rect) -> 'TextImageView':
+        """
+        Get a view of the part of this image inside *rect*
+
+        :param rect:
+            Area of the image, clipped to the size of the image
+        :returns:
+            A TextImageView that can be used in place of a TextImage
+        """
+        return TextImageView(self, rect)
 
     def print_frame(self) -> None:
-        text_buffer = self.text_buffer
         width = self.size.width
         height = self.size.height
         print("/{}\\".format('=' * width))
         for y in range(height):
-            line = text_buffer[y * width: (y + 1) * width].tounicode()
-            print("|{}|".format(line))
+            print("|{}|".format(self.row_text(y)))
         print("\\{}/".format('=' * width))
 
 
+class TextBuffer:
+    """
+    Array-like access to the characters of a TextImage
+
+    The text of images used to be stored in an array of characters, which
+    was the text_buffer attribute. This keeps code written for it working.
+    Reading and writing single items costs the same as it did, writes go
+    straight to the image and forget the hashes of the rows they touch.
+    Control characters are stored as '?', like put() does. Slices are
+    copies, as with arrays.
+    """
+
+    typecode = _CHARACTER_TYPECODE
+
+    def __init__(self, image: 'TextImage', readonly: bool=False):
+        self.image = image
+        self.readonly = readonly
+
+    def __len__(self):
+        return len(self.image._text)
+
+    def __getitem__(self, index):
+        image = self.image
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                text = image.buffer_text(start, max(start, stop))
+            else:
+                text = image.buffer_text()[index]
+            return array(_CHARACTER_TYPECODE, text)
+        return chr(image._text[index])
+
+    def __setitem__(self, index, value) -> None:
+        if self.readonly:
+            raise TypeError("the text buffer of a view is read-only")
+        image = self.image
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            stop = max(start, stop)
+            if step != 1 or len(value) != stop - start:
+                raise ValueError("only runs of the same length can be set")
+            if isinstance(value, array):
+                value = value.tounicode()
+        else:
+            length = len(self)
+            if not -length <= index < length:
+                raise IndexError("array assignment index out of range")
+            start = index % length
+            stop = start + 1
+            if len(value) != 1:
+                raise TypeError("array item must be a unicode character")
+        if start == stop:
+            return
+        if not value.isprintable():
+            value = value.translate(_CONTROL_REPLACEMENTS)
+        image._text[start:stop] = image._encode(value)
+        if CONTINUATION in value:
+            image._has_wide = True
+        image.invalidate_rows(
+            start // image.width, (stop - 1) // image.width + 1)
+
+    def __iter__(self):
+        return iter(self.image.buffer_text())
+
+    def __repr__(self):
+        return "<TextBuffer {!r}>".format(self.image.buffer_text())
+
+    def tounicode(self) -> str:
+        return self.image.buffer_text()
+
+    def tolist(self) -> list:
+        return list(self.image.buffer_text())
+
+
+class TextImageView:
+    """
+    A rectangular part of a TextImage that behaves like a TextImage.
+
+    Views have their own size and coordinates but read from and write to
+    the buffers of the image they were created from, nothing is copied.
+    Views of views refer directly to the original image so writing through
+    nested views costs the same as writing through one view.
+
+    The buffers of a view (text_buffer, attribute_buffer and the private
+    ones used by OutputEncoder and TextImage.copy_from()) are built on each
+    access from slices of the rows of the image. text_buffer and
+    attribute_buffer are read-only, use the methods of the view to change
+    it. Copying or pickling a view gives a TextImage with the content of
+    the view only.
+    """
+
+    def __init__(self, image: 'TextImage', rect: Rect):
+        if isinstance(image, TextImageView):
+            bounds = Rect(image.x, image.y,
+                          image.x + image.size.width,
+                          image.y + image.size.height)
+            rect = Rect(rect.x1 + image.x, rect.y1 + image.y,
+                        rect.x2 + image.x, rect.y2 + image.y)
+            image = image.image
+        else:
+            bounds = Rect(0, 0, image.size.width, image.size.height)
+        x1 = min(max(rect.x1, bounds.x1), bounds.x2)
+        y1 = min(max(rect.y1, bounds.y1), bounds.y2)
+        x2 = min(max(rect.x2, x1), bounds.x2)
+        y2 = min(max(rect.y2, y1), bounds.y2)
+        self.image = image
+        self.x = x1
+        self.y = y1
+        self.size = Size(x2 - x1, y2 - y1)
+        self.width = self.size.width
+
+    def put(self, x: int, y: int, c: str, pa: int) -> None:
+        """
+        Put character *c* with attributes *pa* into cell at (*x*, *y*)
+
+        See TextImage.put()
+        """
+        assert 0 <= x < self.size.width
+        assert 0 <= y < self.size.height
+        self.image.put(x + self.x, y + self.y, c, pa)
+
+    def fill_rect(self, x1: int, y1: int, x2: int, y2: int,
+                  c: str, pa: int) -> None:
+        """
+        Fill cells from (*x1*, *y1*) to (*x2*, *y2*) (exclusive)
+
+        See TextImage.fill_rect()
+        """
+        assert 0 <= x1 <= x2 <= self.size.width
+        assert 0 <= y1 <= y2 <= self.size.height
+        self.image.fill_rect(
+            x1 + self.x, y1 + self.y, x2 + self.x, y2 + self.y, c, pa)
+
+    def put_text(self, x: int, y: int, text: str, pa: int) -> None:
+        """
+        Put a run of characters with attributes *pa*, starting at (*x*, *y*)
+
+        See TextImage.put_text()
+        """
+        assert 0 <= x and x + len(text) <= self.size.width
+        assert 0 <= y < self.size.height
+        self.image.put_text(x + self.x, y + self.y, text, pa)
+
+    def get(self, x: int, y: int) -> Cell:
+        """
+        Get a cell from (*x*, *y*)
+
+        See TextImage.get()
+        """
+        assert 0 <= x < self.size.width
+        assert 0 <= y < self.size.height
+        return self.image.get(x + self.x, y + self.y)
+
+    def row_hash(self, y: int) -> int:
+        """
+        Get the hash of row *y*
+
+        Unlike in TextImage, hashes of views are not cached.
+        """
+        image = self.image
+        start = self.x + (y + self.y) * image.width
+        return hash((
+            image.buffer_text(start, start + self.width),
+            image._attributes[start:start + self.width].tobytes()))
+
+    def row_hashes(self) -> list:
+        """
+        Get the list of hashes of all the rows, see row_hash()
+        """
+        return [self.row_hash(y) for y in range(self.size.height)]
+
+    def row_text(self, y: int) -> str:
+        """
+        Get the text of row *y* as it should be displayed
+
+        See TextImage.row_text()
+        """
+        image = self.image
+        start = self.x + (y + self.y) * image.width
+        line = image.buffer_text(start, start + self.width)
+        if image._has_wide:
+            line = line.replace(CONTINUATION, '')
+        return line
+
+    def view(self, rect: Rect) -> 'TextImageView':
+        """
+        Get a view of the part of this view inside *rect*
+
+        See TextImage.view()
+        """
+        return TextImageView(self, rect)
+
+    def _rows(self, buffer):
+        """
+        Concatenate the slices of *buffer* that hold the rows of the view
+        """
+        rows = buffer[:0]
+        stride = self.image.width
+        start = self.x + self.y * stride
+        for _ in range(self.size.height):
+            rows += buffer[start:start + self.width]
+            start += stride
+        return rows
+
+    @property
+    def _text(self):
+        return self._rows(self.image._text)
+
+    @property
+    def _attributes(self) -> array:
+        return self._rows(self.image._attributes)
+
+    @property
+    def _codec(self) -> str:
+        return self.image._codec
+
+    @property
+    def _has_wide(self) -> bool:
+        return self.image._has_wide
+
+    @property
+    def _row_hashes(self) -> list:
+        return [None] * self.size.height
+
+    def copy_from(self, other: 'TextImage') -> None:
+        """
+        Replace the content of this view with that of *other*
+
+        Views can't be resized, *other* must have the size of the view.
+        """
+        assert other.size == self.size
+        self.blit(other, Rect(0, 0, self.size.width, self.size.height), 0, 0)
+
+    def blit(self, source: 'TextImage', rect: Rect, x: int, y: int) -> None:
+        """
+        Copy the cells of *source* inside *rect* to (*x*, *y*) of this view
+
+        See TextImage.blit()
+        """
+        assert 0 <= x and x + rect.x2 - rect.x1 <= self.size.width
+        assert 0 <= y and y + rect.y2 - rect.y1 <= self.size.height
+        self.image.blit(source, rect, x + self.x, y + self.y)
+
+    def __deepcopy__(self, memo: dict) -> TextImage:
+        return self.copy()
+
+    def __reduce__(self):
+        return TextImage.__new__, (TextImage,), self.copy().__getstate__()
+
+    @property
+    def text_buffer(self) -> TextBuffer:
+        return TextBuffer(self.copy(), readonly=True)
+
+    @property
+    def attribute_buffer(self) -> memoryview:
+        return memoryview(self._attributes).toreadonly()
+
+    buffer_text = TextImage.buffer_text
+    attributes_used = TextImage.attributes_used
+    copy = TextImage.copy
+    __eq__ = TextImage.__eq__
+    __hash__ = TextImage.__hash__
+    print_frame = TextImage.print_frame
+
+
 class TextAttributes:
+    """
+    Foreground color, background color and style of text
+
+    Colors can be any of the 16 ANSI colors, an index into the 256-color
+    palette or a 24-bit color created with textland.color.rgb().
+    """
 
     def __init__(self):
         self.fg = WHITE
@@ -109,14 +868,16 @@ class TextAttributes:
 
     @property
     def packed(self):
-        return ((self.fg & 15) << 8) + ((self.bg & 15) << 4) + (self.style & 3)
+        return (((self.fg & COLOR_MASK) << FG_SHIFT)
+                | ((self.bg & COLOR_MASK) << BG_SHIFT)
+                | (self.style & STYLE_MASK))
 
     @staticmethod
     def unpack(pa: int) -> (int, int, int):
         """
         Unpack packed attributes into (fg, bg, style)
         """
-        fg = (pa >> 8) & 15
-        bg = (pa >> 4) & 15
-        style = pa & 3
+        fg = (pa >> FG_SHIFT) & COLOR_MASK
+        bg = (pa >> BG_SHIFT) & COLOR_MASK
+        style = pa & STYLE_MASK
         return fg, bg, style
@@ -0,0 +1,179 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Terminal input read in a background thread.
+"""
+
+from collections import deque
+import os
+import select
+import threading
+
+from .ansi import InputParser
+from .events import Event
+from .events import coalesce_motion
+
+
+class InputThread:
+    """
+    Reader of terminal input running in a dedicated thread
+
+    The thread reads and parses terminal input as soon as it arrives, even
+    while the main thread is busy handling events or writing a large frame.
+    Parsed events are appended to a queue and a byte is written to a
+    wake-up pipe, so the main thread can wait for events with select(),
+    together with any other file descriptors it is interested in.
+
+    Thread-safety rules: the input thread only ever creates Event objects.
+    Applications and the images they return are only touched by the thread
+    that runs the display. Other threads must not modify images handed over
+    to the display, they can use post() to ask the main thread to do work
+    (for example to repaint) instead.
+    """
+
+    def __init__(self, fd: int, parser: InputParser=None):
+        """
+        Initialize a new input thread
+
+        :param fd:
+            File descriptor to read input from
+        :param parser:
+            Parser of the input, a new InputParser by default
+        """
+        self._fd = fd
+        self._parser = parser if parser is not None else InputParser()
+        # collections.deque supports appending and popping from different
+        # threads without any extra locking.
+        self._events = deque()
+        # Events taken off the queue, only used by the main thread
+        self._ready = deque()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._stop_r, self._stop_w = os.pipe()
+        for fd in (self._wakeup_r, self._wakeup_w):
+            os.set_blocking(fd, False)
+        self._thread = threading.Thread(
+            target=self._run, name="textland-input", daemon=True)
+        self.closed = False
+
+    @property
+    def wakeup_fd(self) -> int:
+        """
+        File descriptor that becomes readable when events are waiting
+        """
+        return self._wakeup_r
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the input thread and release all resources
+        """
+        if self._thread.is_alive():
+            os.write(self._stop_w, b'\0')
+            self._thread.join()
+        for fd in (self._wakeup_r, self._wakeup_w, self._stop_r,
+                   self._stop_w):
+            os.close(fd)
+
+    def post(self, event: Event) -> None:
+        """
+        Queue an event and wake up the main thread
+
+        This can be called from any thread and from signal handlers.
+        """
+        self._events.append(event)
+        self._wake()
+
+    def has_event(self) -> bool:
+        """
+        Check if get_event() would return without waiting
+        """
+        return bool(self._ready or self._events)
+
+    def get_event(self, timeout: float=None, fds: list=()) -> Event:
+        """
+        Get the next event, waiting for it if necessary
+
+        :param timeout:
+            Maximum time to wait, in seconds, or None to wait forever
+        :param fds:
+            Other file descriptors to wait on, any of them becoming
+            readable stops the wait
+        :returns:
+            The next event or None if the timeout has expired, one of *fds*
+            is readable or the input was closed (see the closed attribute)
+
+        Mouse motion events followed by another motion event with the same
+        buttons held down are skipped, so that drags don't fall behind.
+        """
+        events = self._events
+        while True:
+            if events:
+                ready = self._ready
+                while events:
+                    ready.append(events.popleft())
+                self._ready = deque(coalesce_motion(ready))
+            if self._ready:
+                return self._ready.popleft()
+            if self.closed:
+                return None
+            ready = select.select(
+                [self._wakeup_r] + list(fds), [], [], timeout)[0]
+            if ready != [self._wakeup_r]:
+                return None
+            self.drain_wakeups()
+
+    def drain_wakeups(self) -> None:
+        """
+        Discard pending wake-up bytes, before looking at the queue
+        """
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except BlockingIOError:
+            pass  # The pipe is full so the main thread will wake up anyway
+
+    def _run(self) -> None:
+        parser = self._parser
+        while True:
+            # Give up waiting for the rest of incomplete escape sequences
+            timeout = 0.05 if parser.has_pending_input else None
+            ready = select.select(
+                [self._fd, self._stop_r], [], [], timeout)[0]
+            if self._stop_r in ready:
+                return
+            if self._fd in ready:
+                data = os.read(self._fd, 4096)
+                if not data:
+                    self.closed = True
+                    self._wake()
+                    return
+                events = parser.feed(data)
+            else:
+                events = parser.flush()
+            if events:
+                self._events.extend(events)
+                self._wake()
@@ -0,0 +1,277 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Text layout engine.
+
+Text is laid out one paragraph (one source line) at a time. Each wrapped
+paragraph is cached by (paragraph, width, mode) so repainting the same text
+at the same width does not wrap anything again.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict
+import re
+
+from .width import cut_to_width, text_width
+
+# Constants for the wrapping mode
+WRAP_WORD = "word"
+WRAP_CHAR = "char"
+
+# Optional leading whitespace followed by one word
+_WORD_RE = re.compile(r'\s*\S+')
+
+
+def wrap_paragraph(paragraph: str, width: int, mode: str=WRAP_WORD) -> tuple:
+    """
+    Wrap one paragraph (text without newlines) to the specified width
+
+    :param paragraph:
+        Text to wrap, without any newlines
+    :param width:
+        Maximum number of cells in each line
+    :param mode:
+        Either WRAP_WORD or WRAP_CHAR
+    :returns:
+        A tuple of lines. Empty paragraphs produce one empty line.
+    """
+    if width <= 0:
+        return ()
+    if text_width(paragraph) <= width:
+        return (paragraph,)
+    if mode == WRAP_CHAR:
+        lines = []
+        while paragraph:
+            line, paragraph = _cut(paragraph, width)
+            lines.append(line)
+        return tuple(lines)
+    elif mode != WRAP_WORD:
+        raise ValueError("Unsupported wrapping mode: {!r}".format(mode))
+    lines = []
+    line = ''
+    used = 0
+    for match in _WORD_RE.finditer(paragraph):
+        token = match.group()
+        token_width = text_width(token)
+        if used + token_width <= width:
+            line += token
+            used += token_width
+            continue
+        if line:
+            lines.append(line)
+            token = token.lstrip()
+            token_width = text_width(token)
+        # Words that don't fit on a line of their own are broken anywhere
+        while token_width > width:
+            head, token = _cut(token, width)
+            lines.append(head)
+            token_width = text_width(token)
+        line = token
+        used = token_width
+    lines.append(line)
+    return tuple(lines)
+
+
+def _cut(text: str, width: int) -> (str, str):
+    """
+    Same as cut_to_width() but always makes progress
+    """
+    head, tail = cut_to_width(text, width)
+    if not head:
+        # A wide character doesn't fit in a one-cell wide line
+        head, tail = text[:1], text[1:]
+    return head, tail
+
+
+def truncate(line: str, width: int, ellipsis: str) -> str:
+    """
+    Truncate a line to the specified width, ending it with *ellipsis*
+    """
+    if text_width(line) <= width:
+        return line
+    ellipsis = cut_to_width(ellipsis, width)[0]
+    return cut_to_width(line, width - text_width(ellipsis))[0] + ellipsis
+
+
+class LayoutCache:
+    """
+    Least-recently-used cache of wrapped paragraphs and laid out texts
+    """
+
+    def __init__(self, capacity: int=1024):
+        self.capacity = capacity
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def _lookup(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _store(self, key, value) -> None:
+        self._data[key] = value
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+    def wrap(self, paragraph: str, width: int, mode: str=WRAP_WORD) -> tuple:
+        """
+        Same as wrap_paragraph() but cached
+        """
+        # Short paragraphs are the common case, don't bother caching them
+        if len(paragraph) <= width and paragraph.isascii():
+            return (paragraph,)
+        key = (paragraph, width, mode)
+        lines = self._lookup(key)
+        if lines is None:
+            lines = wrap_paragraph(paragraph, width, mode)
+            self._store(key, lines)
+        return lines
+
+    def layout(self, text: str, width: int, mode: str=WRAP_WORD,
+               max_lines: int=None, ellipsis: str=None) -> tuple:
+        """
+        Lay out a multi-line text
+
+        :param text:
+            Text to lay out, may contain newlines
+        :param width:
+            Maximum number of cells in each line
+        :param mode:
+            Either WRAP_WORD or WRAP_CHAR
+        :param max_lines:
+            Maximum number of lines to produce (None means unlimited)
+        :param ellipsis:
+            If set, the last line of a text that had to be cut short is
+            truncated and ends with this string
+        :returns:
+            A tuple of lines
+        """
+        key = (text, width, mode, max_lines, ellipsis)
+        lines = self._lookup(key)
+        if lines is not None:
+            return lines
+        lines = []
+        for paragraph in text.splitlines():
+            lines.extend(self.wrap(paragraph, width, mode))
+            if max_lines is not None and len(lines) > max_lines:
+                break
+        if max_lines is not None and len(lines) > max_lines:
+            del lines[max_lines:]
+            if ellipsis is not None and lines:
+                lines[-1] = truncate(
+                    lines[-1] + ellipsis, width, ellipsis)
+        lines = tuple(lines)
+        self._store(key, lines)
+        return lines
+
+
+# Cache shared by DrawingContext and TextLayout
+default_cache = LayoutCache()
+
+
+class TextLayout:
+    """
+    Incremental layout of a (possibly very long) document
+
+    Paragraphs are wrapped lazily, only as far as the requested range of
+    visual lines requires. The number of visual lines of each paragraph is
+    remembered for the few most recently used widths so that scrolling
+    does not lay out anything again and resizing only lays out what is
+    visible at the new width.
+    """
+
+    def __init__(self, text: str, mode: str=WRAP_WORD,
+                 cache: LayoutCache=None, max_widths: int=4):
+        """
+        Initialize a new layout
+
+        :param max_widths:
+            Number of widths for which the line counts are remembered
+        """
+        self.paragraphs = text.splitlines()
+        self.mode = mode
+        self.cache = cache if cache is not None else default_cache
+        self.max_widths = max_widths
+        # width -> list of the index of the first visual line of each
+        # paragraph that has been laid out so far, least recently used
+        # width first
+        self._starts = OrderedDict()
+
+    def _extend(self, width: int, line_no: int) -> list:
+        """
+        Lay out paragraphs until *line_no* is covered or text runs out
+        """
+        starts = self._starts.get(width)
+        if starts is None:
+            starts = self._starts[width] = [0]
+            if len(self._starts) > self.max_widths:
+                self._starts.popitem(last=False)
+        else:
+            self._starts.move_to_end(width)
+        while (len(starts) <= len(self.paragraphs)
+               and starts[-1] <= line_no):
+            paragraph = self.paragraphs[len(starts) - 1]
+            starts.append(
+                starts[-1] + len(self.cache.wrap(paragraph, width, self.mode)))
+        return starts
+
+    def line_count(self, width: int) -> int:
+        """
+        Get the total number of visual lines at the specified width
+        """
+        if width <= 0:
+            return 0
+        return self._extend(width, float('inf'))[-1]
+
+    def lines(self, width: int, start: int=0, count: int=None) -> list:
+        """
+        Get *count* visual lines, starting at visual line *start*
+
+        :param width:
+            Maximum number of cells in each line
+        :param start:
+            Index of the first visual line to return
+        :param count:
+            Number of lines to return (None means all the remaining lines)
+        :returns:
+            A list of lines, shorter than *count* if the text ends sooner
+        """
+        if width <= 0:
+            return []
+        stop = float('inf') if count is None else start + count
+        starts = self._extend(width, stop - 1)
+        index = bisect_right(starts, start) - 1
+        result = []
+        line_no = starts[index]
+        while index < len(starts) - 1 and line_no < stop:
+            for line in self.cache.wrap(
+                    self.paragraphs[index], width, self.mode):
+                if start <= line_no < stop:
+                    result.append(line)
+                line_no += 1
+            index += 1
+        return result
@@ -0,0 +1,124 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+from time import monotonic
+
+
+class FramePacer:
+    """
+    Adaptive frame rate limit of a display
+
+    Displays report how long it took to get each frame out to the terminal,
+    ideally including the time it took the terminal to drain the output,
+    and how many bytes were written. The frame rate is limited so that
+    writing frames takes at most a fixed share of the time, so on slow
+    terminals (SSH sessions, serial consoles) there is always time left to
+    handle events and events that arrive in the meantime are handled without
+    showing the intermediate frames. The most recent frame is always shown
+    once there are no more events to handle, so the screen converges to the
+    latest state.
+    """
+
+    def __init__(self, max_rate: float=60.0, output_share: float=0.5,
+                 smoothing: float=0.25):
+        """
+        Initialize a new pacer
+
+        :param max_rate:
+            Maximum number of frames per second, even on fast terminals
+        :param output_share:
+            Maximum share of the time spent writing frames while there are
+            events waiting to be handled
+        :param smoothing:
+            Weight of the most recent frame in the moving averages
+        """
+        self.max_rate = max_rate
+        self.output_share = output_share
+        self.smoothing = smoothing
+        # Moving average of the time it takes to show one frame
+        self.frame_time = 0.0
+        # Moving average of the output throughput or None if not known
+        self.bytes_per_second = None
+        self.frames_shown = 0
+        self.frames_skipped = 0
+        self._frame_start = None
+        self._frame_bytes = 0
+
+    @property
+    def interval(self) -> float:
+        """
+        Minimum time, in seconds, between the start of consecutive frames
+        """
+        return max(self.frame_time / self.output_share, 1.0 / self.max_rate)
+
+    @property
+    def rate(self) -> float:
+        """
+        Current maximum number of frames per second
+        """
+        return 1.0 / self.interval
+
+    def is_due(self, now: float=None) -> bool:
+        """
+        Check if enough time has passed to show another frame
+        """
+        if self._frame_start is None:
+            return True
+        if now is None:
+            now = monotonic()
+        return now - self._frame_start >= self.interval
+
+    def begin_frame(self, now: float=None) -> None:
+        """
+        Note that a frame is about to be written
+        """
+        self._frame_start = monotonic() if now is None else now
+        self._frame_bytes = 0
+
+    def add_bytes(self, count: int) -> None:
+        """
+        Note that *count* bytes of the current frame have been written
+        """
+        self._frame_bytes += count
+
+    def end_frame(self, now: float=None) -> None:
+        """
+        Note that the current frame has been written (and drained)
+        """
+        if now is None:
+            now = monotonic()
+        duration = now - self._frame_start
+        alpha = self.smoothing
+        if self.frames_shown == 0:
+            self.frame_time = duration
+        else:
+            self.frame_time += alpha * (duration - self.frame_time)
+        if self._frame_bytes and duration > 0:
+            throughput = self._frame_bytes / duration
+            if self.bytes_per_second is None:
+                self.bytes_per_second = throughput
+            else:
+                self.bytes_per_second += alpha * (
+                    throughput - self.bytes_per_second)
+        self.frames_shown += 1
+
+    def skip_frame(self) -> None:
+        """
+        Note that a frame was not shown because a newer one was coming
+        """
+        self.frames_skipped += 1
@@ -0,0 +1,119 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Rendering of large images on all the cores of the machine.
+
+The image is split into bands of whole rows. Each band is rendered by a
+worker process, running the same render callable with a DrawingContext
+that covers the whole image, and copied into the image with bulk copies
+once it is done. Cells outside of the band of a worker are simply dropped,
+so the result is exactly the same as when rendering in one process.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from .bits import Cell, Rect, Size
+from .drawing import DrawingContext
+from .image import TextImage
+
+_BLANK = Cell(' ', 0)
+
+
+class _BandCanvas:
+    """
+    Image of the full size that only stores rows *y1* to *y2* (exclusive)
+    """
+
+    def __init__(self, size: Size, y1: int, y2: int):
+        self.size = size
+        self.width = size.width
+        self.y1 = y1
+        self.y2 = y2
+        self.image = TextImage(Size(size.width, y2 - y1))
+
+    def put(self, x: int, y: int, c: str, pa: int) -> None:
+        if self.y1 <= y < self.y2:
+            self.image.put(x, y - self.y1, c, pa)
+
+    def fill_rect(self, x1: int, y1: int, x2: int, y2: int,
+                  c: str, pa: int) -> None:
+        y1 = max(y1, self.y1)
+        y2 = min(y2, self.y2)
+        if y1 < y2:
+            self.image.fill_rect(x1, y1 - self.y1, x2, y2 - self.y1, c, pa)
+
+    def put_text(self, x: int, y: int, text: str, pa: int) -> None:
+        if self.y1 <= y < self.y2:
+            self.image.put_text(x, y - self.y1, text, pa)
+
+    def get(self, x: int, y: int) -> Cell:
+        if self.y1 <= y < self.y2:
+            return self.image.get(x, y - self.y1)
+        return _BLANK
+
+
+def _render_band(render, size: Size, y1: int, y2: int) -> TextImage:
+    """
+    Render one band, in a worker process
+    """
+    canvas = _BandCanvas(size, y1, y2)
+    render(DrawingContext(canvas), Rect(0, y1, size.width, y2))
+    return canvas.image
+
+
+def render_parallel(image: TextImage, render, band_height: int=None,
+                    executor=None) -> None:
+    """
+    Render an image using several processes
+
+    :param image:
+        The image to render into. It starts out blank in each worker, what
+        it contains now is replaced.
+    :param render:
+        A picklable callable (for example a module-level function) taking
+        a DrawingContext and the Rect of the band being rendered. It has to
+        paint the whole image as if it was rendering alone, but it can skip
+        anything outside of the band to save time.
+    :param band_height:
+        Number of rows rendered by each task. By default the image is split
+        into four bands per CPU so that the load stays balanced.
+    :param executor:
+        A concurrent.futures executor to use. By default a new
+        ProcessPoolExecutor is created and shut down when done.
+    """
+    width, height = image.size
+    if height == 0:
+        return
+    if band_height is None:
+        band_height = max(1, -(-height // (4 * (os.cpu_count() or 1))))
+    bands = [(y, min(y + band_height, height))
+             for y in range(0, height, band_height)]
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    try:
+        futures = [executor.submit(_render_band, render, image.size, y1, y2)
+                   for y1, y2 in bands]
+        for (y1, y2), future in zip(bands, futures):
+            band = future.result()
+            image.blit(band, Rect(0, 0, width, y2 - y1), 0, y1)
+    finally:
+        if own_executor:
+            executor.shutdown()
@@ -0,0 +1,195 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Detection of terminal resizes.
+
+Resizes are signalled with SIGWINCH. The signal handler only writes to a
+pipe, which the display waits on together with the terminal input. While
+the user drags the edge of a window the terminal sends many signals in a
+row; they are collapsed into one resize, reported once no signal has
+arrived for a short while and only if the size has actually changed.
+"""
+
+from time import monotonic
+import os
+import signal
+import struct
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
+from .bits import Size
+
+
+def terminal_size(fd: int) -> Size:
+    """
+    Get the size of the terminal, as known by the kernel
+
+    :param fd:
+        File descriptor of the terminal
+    """
+    if fcntl is not None:
+        try:
+            rows, columns = struct.unpack('hhhh', fcntl.ioctl(
+                fd, termios.TIOCGWINSZ, b'\0' * 8))[:2]
+        except OSError:
+            pass
+        else:
+            return Size(columns, rows)
+    columns, rows = os.get_terminal_size(fd)
+    return Size(columns, rows)
+
+
+class ResizeMonitor:
+    """
+    Debounced monitor of the size of a terminal
+
+    The monitor has to be started from the main thread, which is where
+    Python runs signal handlers. Displays add fileno() to the descriptors
+    they wait on, using timeout() as the timeout, and call poll() whenever
+    they wake up.
+    """
+
+    def __init__(self, fd: int, settle: float=0.05):
+        """
+        Initialize a new monitor
+
+        :param fd:
+            File descriptor of the terminal
+        :param settle:
+            Time, in seconds, without any SIGWINCH after which the size of
+            the terminal is considered settled
+        """
+        self.fd = fd
+        self.settle = settle
+        # The last size that was reported
+        self.size = None
+        self._last_signal = None
+        self._pipe_r = self._pipe_w = None
+        self._installed = False
+        self._saved_handler = None
+
+    def start(self) -> None:
+        """
+        Install the SIGWINCH handler and remember the current size
+
+        Outside of the main thread, signals cannot be handled and the
+        monitor never reports anything.
+        """
+        self.size = terminal_size(self.fd)
+        self._pipe_r, self._pipe_w = os.pipe()
+        for fd in (self._pipe_r, self._pipe_w):
+            os.set_blocking(fd, False)
+        try:
+            self._saved_handler = signal.signal(
+                signal.SIGWINCH, self._on_sigwinch)
+        except ValueError:
+            pass  # Not in the main thread
+        else:
+            self._installed = True
+
+    def stop(self) -> None:
+        if self._installed:
+            # Handlers not installed from Python, like the one of curses,
+            # cannot be restored.
+            if self._saved_handler is None:
+                self._saved_handler = signal.SIG_DFL
+            signal.signal(signal.SIGWINCH, self._saved_handler)
+            self._installed = False
+            self._saved_handler = None
+        if self._pipe_r is not None:
+            os.close(self._pipe_r)
+            os.close(self._pipe_w)
+            self._pipe_r = self._pipe_w = None
+
+    def fileno(self) -> int:
+        """
+        Get the file descriptor that becomes readable on SIGWINCH
+        """
+        return self._pipe_r
+
+    def _on_sigwinch(self, signum, frame) -> None:
+        try:
+            os.write(self._pipe_w, b'\0')
+        except BlockingIOError:
+            pass  # The pipe is full, the display will wake up anyway
+
+    def notify(self) -> None:
+        """
+        Report a resize noticed by other means than SIGWINCH
+        """
+        self._last_signal = monotonic()
+
+    @property
+    def pending(self) -> bool:
+        """
+        Whether a resize has been signalled but not reported yet
+        """
+        self._drain()
+        return self._last_signal is not None
+
+    def size_changed(self) -> bool:
+        """
+        Whether a resize is pending and the size differs from the last one
+
+        Signals that leave the size as it was, for example when the process
+        is brought back to the foreground, are never reported by poll().
+        Displays use this to tell if a resize event is really coming.
+        """
+        return self.pending and terminal_size(self.fd) != self.size
+
+    def timeout(self) -> float:
+        """
+        Get the time until the size settles or None if nothing is pending
+        """
+        if not self.pending:
+            return None
+        return max(0.0, self._last_signal + self.settle - monotonic())
+
+    def poll(self) -> Size:
+        """
+        Get the new size once it has settled
+
+        :returns:
+            The new size or None if the size is not settled yet or it
+            didn't change since it was last reported
+        """
+        if not self.pending:
+            return None
+        if monotonic() - self._last_signal < self.settle:
+            return None
+        self._last_signal = None
+        size = terminal_size(self.fd)
+        if size == self.size:
+            return None
+        self.size = size
+        return size
+
+    def _drain(self) -> None:
+        if self._pipe_r is None:
+            return
+        try:
+            if os.read(self._pipe_r, 4096):
+                self._last_signal = monotonic()
+                while os.read(self._pipe_r, 4096):
+                    pass
+        except BlockingIOError:
+            pass
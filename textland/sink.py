@@ -0,0 +1,189 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Frame sinks of TestDisplay.
+
+A sink is any object with an add_frame(image) method. TestDisplay calls it
+with every frame it is given; the image belongs to the application, so
+sinks that keep frames must copy them. Only ListSink, the default, keeps
+every frame in memory. RingSink, DigestSink and CallbackSink use a fixed
+amount of memory, SpillSink eight bytes per frame.
+"""
+
+from array import array
+from collections import deque
+from copy import deepcopy
+import hashlib
+import pickle
+import tempfile
+
+from .image import TextImage
+
+
+class ListSink(list):
+    """
+    Sink keeping all the frames in a list
+
+    Identical consecutive frames share one copy.
+    """
+
+    def add_frame(self, image: TextImage) -> None:
+        if self and self[-1] == image:
+            self.append(self[-1])
+        else:
+            self.append(deepcopy(image))
+
+
+class RingSink:
+    """
+    Sink keeping only the most recent frames
+
+    The sink can be indexed and iterated over like a list of the frames it
+    still has, from the oldest to the most recent one.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize a new ring sink
+
+        :param capacity:
+            Number of frames to keep
+        """
+        self.frames = deque(maxlen=capacity)
+        # Number of frames added, including the ones that were dropped
+        self.count = 0
+
+    def add_frame(self, image: TextImage) -> None:
+        frames = self.frames
+        if frames and frames[-1] == image:
+            frames.append(frames[-1])
+        else:
+            frames.append(deepcopy(image))
+        self.count += 1
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index: int) -> TextImage:
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+
+def frame_digest(image: TextImage) -> bytes:
+    """
+    Get a digest of the size, text and attributes of an image
+
+    Images that compare equal have the same digest, whichever way their
+    text is stored.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('{}x{}\n'.format(*image.size).encode('ASCII'))
+    text = image.buffer_text()
+    digest.update(text.encode('UTF-8', 'surrogatepass'))
+    digest.update(image.attribute_buffer)
+    return digest.digest()
+
+
+class DigestSink:
+    """
+    Sink keeping only digests of the frames
+
+    *last_digest* is the digest of the most recent frame and *digest* a
+    rolling digest of all the frames so far, each one chained to the
+    previous one, so two runs showed exactly the same frames in the same
+    order if their rolling digests are equal.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last_digest = None
+        self.digest = bytes(16)
+
+    def add_frame(self, image: TextImage) -> None:
+        self.last_digest = frame_digest(image)
+        self.digest = hashlib.blake2b(
+            self.digest + self.last_digest, digest_size=16).digest()
+        self.count += 1
+
+
+class SpillSink:
+    """
+    Sink writing the frames to a file and reading them back on demand
+
+    The sink can be indexed and iterated over like a list of frames. Only
+    the offset of each frame in the file is kept in memory, along with the
+    last frame so that identical consecutive frames are written once.
+    """
+
+    def __init__(self, stream=None):
+        """
+        Initialize a new spill sink
+
+        :param stream:
+            Binary file, open for reading and writing, the frames are
+            written to. By default an anonymous temporary file is used.
+        """
+        if stream is None:
+            stream = tempfile.TemporaryFile()
+        self.stream = stream
+        self._offsets = array('Q')
+        self._last = None
+
+    def add_frame(self, image: TextImage) -> None:
+        stream = self.stream
+        if self._last is not None and self._last == image:
+            self._offsets.append(self._offsets[-1])
+            return
+        stream.seek(0, 2)
+        self._offsets.append(stream.tell())
+        pickle.dump(image, stream, pickle.HIGHEST_PROTOCOL)
+        if self._last is None or self._last.size != image.size:
+            self._last = TextImage(image.size)
+        self._last.copy_from(image)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> TextImage:
+        self.stream.seek(self._offsets[index])
+        return pickle.load(self.stream)
+
+    def __iter__(self):
+        for index in range(len(self._offsets)):
+            yield self[index]
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class CallbackSink:
+    """
+    Sink calling a function with each frame
+
+    The image is only valid during the call, the function must copy it to
+    keep it.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def add_frame(self, image: TextImage) -> None:
+        self.callback(image)
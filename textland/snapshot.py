@@ -0,0 +1,260 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Snapshot (golden file) testing of screens.
+
+A snapshot file stores the text and the attributes of one screen::
+
+    textland-snapshot 12x2
+    @0 0xe00000000
+    @1 0xe00000001
+    |Hello world | 0*12
+    |            | 1*5 0*7
+
+The first line gives the size, lines starting with ``@`` give a short key
+to each packed attribute and each remaining line gives the text of one row
+between bars, followed by the attributes of the row as ``key*count`` runs.
+"""
+
+from array import array
+from os import getenv
+import os
+
+from .bits import Size
+from .image import TextAttributes
+from .image import TextImage
+
+_MAGIC = "textland-snapshot"
+
+
+class SnapshotMismatch(AssertionError):
+    """
+    Exception raised when a screen doesn't match its snapshot
+    """
+
+
+class Snapshot:
+    """
+    Expected text and attributes of a screen
+    """
+
+    def __init__(self, size: Size, rows: list, attributes: array):
+        """
+        Initialize a new snapshot
+
+        :param size:
+            Size of the screen
+        :param rows:
+            Text of each row, as returned by TextImage.row_text()
+        :param attributes:
+            Packed attributes of all the cells, row by row
+        """
+        self.size = size
+        self.rows = rows
+        self.attributes = attributes
+
+    @classmethod
+    def from_image(cls, image: TextImage) -> 'Snapshot':
+        return cls(image.size,
+                   [image.row_text(y) for y in range(image.size.height)],
+                   image.attribute_buffer[:])
+
+    @classmethod
+    def parse(cls, text: str) -> 'Snapshot':
+        """
+        Parse the contents of a snapshot file
+        """
+        lines = text.split('\n')
+        magic, _, size = lines[0].partition(' ')
+        if magic != _MAGIC:
+            raise ValueError("not a textland snapshot")
+        width, height = (int(part) for part in size.split('x'))
+        legend = {}
+        rows = []
+        attributes = array('Q')
+        for line in lines[1:]:
+            if line.startswith('@'):
+                key, value = line[1:].split()
+                legend[key] = int(value, 16)
+            elif line.startswith('|'):
+                end = line.rindex('|')
+                rows.append(line[1:end])
+                for run in line[end + 1:].split():
+                    key, count = run.split('*')
+                    attributes.extend(array('Q', [legend[key]]) * int(count))
+        if len(rows) != height or len(attributes) != width * height:
+            raise ValueError("snapshot doesn't match its size")
+        return cls(Size(width, height), rows, attributes)
+
+    def dump(self) -> str:
+        """
+        Get the contents of the snapshot file
+        """
+        width, height = self.size
+        legend = {}
+        row_lines = []
+        for y, text in enumerate(self.rows):
+            runs = []
+            start = y * width
+            last = None
+            for pa in self.attributes[start:start + width]:
+                if pa != last:
+                    key = legend.setdefault(pa, len(legend))
+                    runs.append([key, 0])
+                    last = pa
+                runs[-1][1] += 1
+            row_lines.append("|{}| {}".format(text, ' '.join(
+                "{}*{}".format(key, count) for key, count in runs)))
+        lines = ["{} {}x{}".format(_MAGIC, width, height)]
+        lines.extend("@{} {:#x}".format(key, pa) for pa, key in sorted(
+            legend.items(), key=lambda item: item[1]))
+        lines.extend(row_lines)
+        return '\n'.join(lines) + '\n'
+
+    def diff(self, image: TextImage) -> list:
+        """
+        Compare an image with this snapshot
+
+        :returns:
+            A list of human readable lines describing the differences,
+            empty if the image matches
+
+        Rows are compared as a whole first, the differences are only
+        worked out for the rows that don't match.
+        """
+        if image.size != self.size:
+            return ["size: expected {0.width}x{0.height},"
+                    " got {1.width}x{1.height}".format(self.size, image.size)]
+        width = self.size.width
+        actual_attributes = image.attribute_buffer
+        if actual_attributes == self.attributes and all(
+                image.row_text(y) == text for y, text in enumerate(self.rows)):
+            return []
+        lines = []
+        for y, text in enumerate(self.rows):
+            actual_text = image.row_text(y)
+            if actual_text != text:
+                lines.append("row {}: expected |{}|".format(y, text))
+                lines.append("row {}:      got |{}|".format(y, actual_text))
+            start = y * width
+            expected = self.attributes[start:start + width]
+            actual = actual_attributes[start:start + width]
+            if actual != expected:
+                lines.extend(_attribute_diff(y, expected, actual))
+        return lines
+
+    def check(self, image: TextImage, name: str="screen") -> None:
+        """
+        Raise SnapshotMismatch if the image doesn't match this snapshot
+        """
+        lines = self.diff(image)
+        if lines:
+            raise SnapshotMismatch(
+                "{} doesn't match its snapshot:\n{}".format(
+                    name, '\n'.join(lines)))
+
+
+def _attribute_diff(y: int, expected: array, actual: array) -> list:
+    """
+    Describe each run of cells of a row with unexpected attributes
+    """
+    lines = []
+    x = 0
+    width = len(expected)
+    while x < width:
+        if expected[x] == actual[x]:
+            x += 1
+            continue
+        start = x
+        while (x < width and expected[x] != actual[x]
+               and expected[x] == expected[start]
+               and actual[x] == actual[start]):
+            x += 1
+        lines.append("row {}, columns {}-{}: expected {}, got {}".format(
+            y, start, x - 1, _describe(expected[start]),
+            _describe(actual[start])))
+    return lines
+
+
+def _describe(pa: int) -> str:
+    return "fg {} bg {} style {}".format(*TextAttributes.unpack(pa))
+
+
+class SnapshotStore:
+    """
+    Directory of snapshot files used by tests
+
+    Snapshots are cached once loaded so checking many screens against the
+    same snapshots only parses each file once. If *update* is set, screens
+    that don't match their snapshot (or have none yet) are written as the
+    new snapshots instead of failing. By default this is controlled by the
+    TEXTLAND_UPDATE_SNAPSHOTS environment variable.
+    """
+
+    def __init__(self, directory: str, update: bool=None):
+        self.directory = directory
+        if update is None:
+            update = bool(getenv("TEXTLAND_UPDATE_SNAPSHOTS"))
+        self.update = update
+        self._cache = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".snapshot")
+
+    def load(self, name: str) -> Snapshot:
+        """
+        Load a snapshot or return None if it doesn't exist
+        """
+        snapshot = self._cache.get(name)
+        if snapshot is None:
+            try:
+                with open(self.path(name), encoding='UTF-8',
+                          newline='') as stream:
+                    snapshot = Snapshot.parse(stream.read())
+            except FileNotFoundError:
+                return None
+            self._cache[name] = snapshot
+        return snapshot
+
+    def save(self, name: str, image: TextImage) -> None:
+        snapshot = Snapshot.from_image(image)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(name), 'w', encoding='UTF-8',
+                  newline='') as stream:
+            stream.write(snapshot.dump())
+        self._cache[name] = snapshot
+
+    def check(self, name: str, image: TextImage) -> None:
+        """
+        Check that an image matches the snapshot called *name*
+
+        :raises SnapshotMismatch:
+            If the image doesn't match or there is no such snapshot (unless
+            snapshots are being updated)
+        """
+        snapshot = self.load(name)
+        if snapshot is None:
+            if not self.update:
+                raise SnapshotMismatch(
+                    "there is no snapshot {!r}".format(self.path(name)))
+        elif not snapshot.diff(image):
+            return
+        elif not self.update:
+            snapshot.check(image, name)
+        self.save(name, image)
@@ -0,0 +1,245 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Terminal capabilities, cached on disk.
+
+The capabilities that textland needs are read from the compiled terminfo
+entry of $TERM, without curses, and cached in one small binary file per
+terminal type. Most of the cost of reading them is searching the terminfo
+directories for the entry, so the cache records where the entry was found
+and its size and modification time. Later launches read the cache and stat
+the entry, without searching or parsing anything, as long as the entry and
+the variables that control the search are unchanged.
+"""
+
+from collections import namedtuple
+import marshal
+import os
+import re
+import struct
+
+from . import keys
+
+# Indices of the capabilities in the compiled terminfo format, see term.h
+_NUMBERS = {'colors': 13, 'pairs': 14}
+_KEYS = {
+    61: keys.KEY_DOWN,  # kcud1
+    79: keys.KEY_LEFT,  # kcub1
+    83: keys.KEY_RIGHT,  # kcuf1
+    87: keys.KEY_UP,  # kcuu1
+    165: keys.KEY_ENTER,  # kent
+}
+
+_MAGIC_16 = 0o432
+_MAGIC_32 = 0o1036
+
+# Number of colors, number of color pairs and a mapping from input
+# sequences to key names
+TerminalCapabilities = namedtuple(
+    'TerminalCapabilities', ['term', 'colors', 'pairs', 'keys'])
+
+# What is assumed about terminals without a terminfo entry
+_FALLBACK = TerminalCapabilities(None, 8, 64, {})
+
+# Bump when the format of the cache or what is extracted changes
+_CACHE_VERSION = 2
+
+# Terminal types that are safe to use as file names
+_CACHEABLE_TERM = re.compile(r'[A-Za-z0-9_+-][A-Za-z0-9._+-]*')
+
+
+def terminfo_path(term: str) -> str:
+    """
+    Find the compiled terminfo entry of a terminal type
+
+    The same directories as ncurses are searched, in the same order.
+
+    :returns:
+        The path of the entry or None if there is none
+    """
+    if not term or '/' in term or term.startswith('.'):
+        return None
+    directories = []
+    if os.getenv('TERMINFO'):
+        directories.append(os.getenv('TERMINFO'))
+    directories.append(os.path.expanduser('~/.terminfo'))
+    for directory in os.getenv('TERMINFO_DIRS', '').split(':'):
+        directories.append(directory or '/usr/share/terminfo')
+    directories += ['/etc/terminfo', '/lib/terminfo', '/usr/share/terminfo']
+    for directory in directories:
+        # Entries are filed under their first letter, or its hex code on
+        # case-insensitive file systems
+        for subdirectory in (term[0], '{:02x}'.format(ord(term[0]))):
+            path = os.path.join(directory, subdirectory, term)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def parse_terminfo(data: bytes, term: str=None) -> TerminalCapabilities:
+    """
+    Extract the capabilities used by textland from a terminfo entry
+
+    :param data:
+        The compiled terminfo entry, in the legacy or in the 32-bit format
+    :raises ValueError:
+        If the data is not a valid terminfo entry
+    """
+    if len(data) < 12:
+        raise ValueError("terminfo entry is too short")
+    magic, names_size, bools_count, numbers_count, strings_count, \
+        table_size = struct.unpack('<6h', data[:12])
+    if magic == _MAGIC_16:
+        number_format = 'h'
+    elif magic == _MAGIC_32:
+        number_format = 'i'
+    else:
+        raise ValueError("not a terminfo entry")
+    offset = 12 + names_size + bools_count
+    offset += offset % 2  # Numbers are aligned on an even offset
+    number_size = struct.calcsize(number_format)
+    numbers = struct.unpack_from(
+        '<{}{}'.format(numbers_count, number_format), data, offset)
+    offset += numbers_count * number_size
+    string_offsets = struct.unpack_from(
+        '<{}h'.format(strings_count), data, offset)
+    table = data[offset + strings_count * 2:]
+    table = table[:table_size]
+
+    def number(name):
+        index = _NUMBERS[name]
+        if index < len(numbers) and numbers[index] >= 0:
+            return numbers[index]
+        return None
+
+    key_map = {}
+    for index, key in _KEYS.items():
+        if index < len(string_offsets) and string_offsets[index] >= 0:
+            start = string_offsets[index]
+            end = table.find(b'\0', start)
+            if end > start:
+                key_map[table[start:end].decode('Latin-1')] = key
+    colors = number('colors')
+    pairs = number('pairs')
+    return TerminalCapabilities(
+        term,
+        colors if colors is not None else 2,
+        pairs if pairs is not None else 0,
+        key_map)
+
+
+def _search_key() -> tuple:
+    """
+    Get the variables that change where terminfo entries are searched for
+    """
+    return (os.getenv('TERMINFO'), os.getenv('TERMINFO_DIRS'),
+            os.path.expanduser('~'))
+
+
+def _cache_path(term: str, cache_dir: str=None) -> str:
+    """
+    Get the path of the cache file of a terminal type
+
+    :returns:
+        The path or None if *term* can't be used safely in a file name
+    """
+    if _CACHEABLE_TERM.fullmatch(term) is None:
+        return None
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+            'textland')
+    return os.path.join(cache_dir, 'terminfo-{}.bin'.format(term))
+
+
+def _load_cache(cache_path: str, term: str) -> TerminalCapabilities:
+    """
+    Load the capabilities from a cache file if it is still valid
+
+    :returns:
+        The capabilities or None
+    """
+    try:
+        with open(cache_path, 'rb') as stream:
+            (version, search_key, path, size, mtime,
+             colors, pairs, key_map) = marshal.loads(stream.read())
+        if version != _CACHE_VERSION or search_key != _search_key():
+            return None
+        stat = os.stat(path)
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+        return None
+    return TerminalCapabilities(term, colors, pairs, key_map)
+
+
+def _save_cache(cache_path: str, path: str,
+                capabilities: TerminalCapabilities) -> None:
+    try:
+        stat = os.stat(path)
+        data = marshal.dumps((
+            _CACHE_VERSION, _search_key(), path,
+            stat.st_size, stat.st_mtime_ns) + tuple(capabilities[1:]))
+        # Write to a temporary file first, concurrent launches may be
+        # reading
+        temp_path = '{}.{}'.format(cache_path, os.getpid())
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, 'wb') as stream:
+            stream.write(data)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+
+
+def load_capabilities(term: str=None,
+                      cache_dir: str=None) -> TerminalCapabilities:
+    """
+    Get the capabilities of a terminal type, using the cache if possible
+
+    :param term:
+        The terminal type, $TERM by default
+    :param cache_dir:
+        Directory of the cache files, $XDG_CACHE_HOME/textland by default
+    :returns:
+        The capabilities, or conservative defaults if the terminal has no
+        usable terminfo entry
+
+    The cache is used while the terminfo entry it was made from keeps its
+    size and modification time and $TERMINFO, $TERMINFO_DIRS and $HOME
+    are unchanged. Failing to read or write the cache is not an error,
+    the capabilities are then simply read from the terminfo entry.
+    """
+    if term is None:
+        term = os.getenv('TERM', '')
+    cache_path = _cache_path(term, cache_dir)
+    if cache_path is not None:
+        capabilities = _load_cache(cache_path, term)
+        if capabilities is not None:
+            return capabilities
+    path = terminfo_path(term)
+    if path is None:
+        return _FALLBACK._replace(term=term)
+    try:
+        with open(path, 'rb') as stream:
+            capabilities = parse_terminfo(stream.read(), term)
+    except (OSError, ValueError):
+        return _FALLBACK._replace(term=term)
+    if cache_path is not None:
+        _save_cache(cache_path, path, capabilities)
+    return capabilities
@@ -0,0 +1,231 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Sparse canvases made of lazily allocated tiles.
+"""
+
+from .bits import Cell, Rect, Size
+from .image import TextImage
+from .width import CONTINUATION
+
+_BLANK = Cell(' ', 0)
+
+
+class TiledTextImage:
+    """
+    A text image much larger than the screen, allocated one tile at a time
+
+    The canvas is divided into square tiles, each one a small TextImage.
+    Tiles are only allocated when something is written to them and tiles
+    that are completely blanked by fill_rect() are freed, so memory scales
+    with the content rather than with the size of the canvas. Blank cells
+    are spaces with packed attributes 0, like in a new TextImage.
+
+    The canvas supports put(), fill_rect(), put_text() and get() so a
+    DrawingContext can paint on it. Use copy_to() to show a part of it.
+    """
+
+    def __init__(self, size: Size, tile_size: int=64):
+        """
+        Initialize a new, blank canvas
+
+        :param size:
+            Size of the whole canvas
+        :param tile_size:
+            Width and height of the tiles, in cells
+        """
+        self.size = size
+        self.width = size.width
+        self.tile_size = tile_size
+        # (column, row) of tile -> TextImage
+        self.tiles = {}
+
+    def _tile(self, column: int, row: int) -> TextImage:
+        """
+        Get a tile, allocating it if necessary
+        """
+        tile = self.tiles.get((column, row))
+        if tile is None:
+            tile = self.tiles[column, row] = TextImage(
+                Size(self.tile_size, self.tile_size))
+        return tile
+
+    def _split_wide(self, x1: int, x2: int, y: int) -> None:
+        """
+        Blank halves of wide characters sticking out of cells *x1* to *x2*
+
+        Tiles take care of wide characters inside of them, this only deals
+        with those that straddle two tiles.
+        """
+        size = self.tile_size
+        if x1 % size == 0 and x1 > 0 and self.get(x1, y).char == CONTINUATION:
+            self._put(x1 - 1, y, ' ', self.get(x1 - 1, y).attributes)
+        if (x2 % size == 0 and x2 < self.width
+                and self.get(x2, y).char == CONTINUATION):
+            self._put(x2, y, ' ', self.get(x2, y).attributes)
+
+    def _put(self, x: int, y: int, c: str, pa: int) -> None:
+        size = self.tile_size
+        self._tile(x // size, y // size).put(x % size, y % size, c, pa)
+
+    def put(self, x: int, y: int, c: str, pa: int) -> None:
+        """
+        Put character *c* with attributes *pa* into cell at (*x*, *y*)
+
+        See TextImage.put()
+        """
+        assert 0 <= x < self.size.width
+        assert 0 <= y < self.size.height
+        if c != CONTINUATION:
+            self._split_wide(x, x + 1, y)
+        elif ((x + 1) % self.tile_size == 0 and x + 1 < self.width
+                and self.get(x + 1, y).char == CONTINUATION):
+            # The cell is the left half of a wide character in the next tile
+            self._put(x + 1, y, ' ', self.get(x + 1, y).attributes)
+        self._put(x, y, c, pa)
+
+    def fill_rect(self, x1: int, y1: int, x2: int, y2: int,
+                  c: str, pa: int) -> None:
+        """
+        Fill cells from (*x1*, *y1*) to (*x2*, *y2*) (exclusive)
+
+        See TextImage.fill_rect()
+        """
+        assert 0 <= x1 <= x2 <= self.size.width
+        assert 0 <= y1 <= y2 <= self.size.height
+        if x1 == x2 or y1 == y2:
+            return
+        for y in range(y1, y2):
+            self._split_wide(x1, x2, y)
+        size = self.tile_size
+        blank = c == ' ' and pa == 0
+        for row in range(y1 // size, (y2 - 1) // size + 1):
+            top = row * size
+            for column in range(x1 // size, (x2 - 1) // size + 1):
+                left = column * size
+                rect = Rect(max(x1 - left, 0), max(y1 - top, 0),
+                            min(x2 - left, size), min(y2 - top, size))
+                if blank and rect == Rect(0, 0, size, size):
+                    # A blank tile is the same as no tile at all
+                    self.tiles.pop((column, row), None)
+                elif blank and (column, row) not in self.tiles:
+                    continue
+                else:
+                    self._tile(column, row).fill_rect(
+                        rect.x1, rect.y1, rect.x2, rect.y2, c, pa)
+
+    def put_text(self, x: int, y: int, text: str, pa: int) -> None:
+        """
+        Put a run of characters with attributes *pa*, starting at (*x*, *y*)
+
+        See TextImage.put_text()
+        """
+        length = len(text)
+        assert 0 <= x and x + length <= self.size.width
+        assert 0 <= y < self.size.height
+        if length == 0:
+            return
+        self._split_wide(x, x + length, y)
+        size = self.tile_size
+        row, tile_y = divmod(y, size)
+        start = 0
+        while start < length:
+            column, tile_x = divmod(x + start, size)
+            end = min(length, start + size - tile_x)
+            self._tile(column, row).put_text(
+                tile_x, tile_y, text[start:end], pa)
+            start = end
+
+    def get(self, x: int, y: int) -> Cell:
+        """
+        Get a cell from (*x*, *y*)
+
+        See TextImage.get()
+        """
+        size = self.tile_size
+        tile = self.tiles.get((x // size, y // size))
+        if tile is None:
+            return _BLANK
+        return tile.get(x % size, y % size)
+
+    def copy_to(self, target: TextImage, x: int, y: int) -> None:
+        """
+        Copy the part of the canvas at (*x*, *y*) into *target*
+
+        :param target:
+            Image to copy to, usually the screen. The part of the canvas
+            that is copied has the size of this image. Cells outside of the
+            canvas are blank.
+        :param x, y:
+            Position of the top-left corner of the target on the canvas
+
+        Only the tiles that intersect the target are looked at. Tiles that
+        were never written to are copied as blank fills. Wide characters cut
+        in half by the edges of the target are replaced by spaces.
+        """
+        width, height = target.size
+        if width == 0 or height == 0:
+            return
+        target.fill_rect(0, 0, width, height, ' ', 0)
+        visible = Rect(x, y, x + width, y + height).intersection(
+            Rect(0, 0, self.size.width, self.size.height))
+        if visible.is_empty():
+            return
+        size = self.tile_size
+        for row in range(visible.y1 // size, (visible.y2 - 1) // size + 1):
+            for column in range(
+                    visible.x1 // size, (visible.x2 - 1) // size + 1):
+                tile = self.tiles.get((column, row))
+                if tile is None:
+                    continue
+                left = column * size
+                top = row * size
+                part = visible.intersection(
+                    Rect(left, top, left + size, top + size))
+                target.blit(tile, part.translated(-left, -top),
+                            part.x1 - x, part.y1 - y)
+        # The right half of a wide character may be outside of the target
+        cut_right = x + width < self.size.width
+        for ty in range(visible.y1 - y, visible.y2 - y):
+            cell = target.get(0, ty)
+            if cell.char == CONTINUATION:
+                target.put(0, ty, ' ', cell.attributes)
+            if cut_right and self.get(x + width, y + ty).char == CONTINUATION:
+                cell = target.get(width - 1, ty)
+                target.put(width - 1, ty, ' ', cell.attributes)
+
+    def row_text(self, y: int) -> str:
+        """
+        Get the text of row *y* as it should be displayed
+
+        See TextImage.row_text()
+        """
+        size = self.tile_size
+        row, tile_y = divmod(y, size)
+        chunks = []
+        for column in range((self.size.width + size - 1) // size):
+            tile = self.tiles.get((column, row))
+            width = min(size, self.size.width - column * size)
+            if tile is None:
+                chunks.append(' ' * width)
+            else:
+                start = tile_y * size
+                chunks.append(tile.buffer_text(start, start + width).replace(
+                    CONTINUATION, ''))
+        return ''.join(chunks)
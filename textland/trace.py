@@ -0,0 +1,275 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recording and replaying of event traces.
+
+A trace is a text file with one JSON array per event: the time since the
+start of the recording, in seconds, the kind of the event and the fields of
+its data, for example ``[1.25, "keyboard", "KeyboardData", "q"]``.
+RecordingDisplay writes a trace of everything an application receives from
+any other display, replay_trace() feeds a trace back into an application
+without a terminal, measuring how long it takes to handle each event.
+"""
+
+from collections import deque
+from math import ceil
+from time import monotonic, sleep
+import json
+
+from .abc import IApplication
+from .abc import IDisplay
+from .bits import Size
+from .display import TestDisplay
+from .encoder import OutputEncoder
+from .events import EVENT_RESIZE
+from .events import Event, KeyboardData, MouseData
+from .image import TextImage
+
+# Types of event data that can be recorded, by name
+_DATA_TYPES = {cls.__name__: cls for cls in (KeyboardData, MouseData, Size)}
+
+
+def dump_event(timestamp: float, event: Event) -> str:
+    """
+    Encode one event as a line of a trace (without the newline)
+
+    Event data of types other than KeyboardData, MouseData and Size is not
+    recorded.
+    """
+    record = [round(timestamp, 6), event.kind]
+    data_type = type(event.data).__name__
+    if data_type in _DATA_TYPES:
+        record.append(data_type)
+        record.extend(event.data)
+    return json.dumps(record, separators=(',', ':'))
+
+
+def load_event(line: str) -> (float, Event):
+    """
+    Decode one line of a trace into (timestamp, event)
+    """
+    record = json.loads(line)
+    if len(record) > 2:
+        data = _DATA_TYPES[record[2]](*record[3:])
+    else:
+        data = None
+    return record[0], Event(record[1], data)
+
+
+def read_trace(stream) -> list:
+    """
+    Read a whole trace from a text stream
+
+    :returns:
+        A list of (timestamp, event) tuples
+    """
+    return [load_event(line) for line in stream if line.strip()]
+
+
+class _RecordingApplication(IApplication):
+    """
+    Application that records events before passing them on
+    """
+
+    def __init__(self, app: IApplication, stream):
+        self.app = app
+        self.stream = stream
+        self.start = None
+
+    def consume_event(self, event: Event) -> TextImage:
+        now = monotonic()
+        if self.start is None:
+            self.start = now
+        # Flushed right away so that traces survive crashes
+        self.stream.write(dump_event(now - self.start, event) + '\n')
+        self.stream.flush()
+        return self.app.consume_event(event)
+
+
+class RecordingDisplay(IDisplay):
+    """
+    Display that records a trace of the events received by an application
+
+    The events come from another display, which does all the actual work.
+    Events are recorded in the order they are given to the application,
+    with monotonic timestamps.
+    """
+
+    def __init__(self, display: IDisplay, stream):
+        """
+        Initialize a new recording display
+
+        :param display:
+            Display that is used to run the application
+        :param stream:
+            Text stream the trace is written to
+        """
+        self.display = display
+        self.stream = stream
+
+    def run(self, app: IApplication) -> None:
+        return self.display.run(_RecordingApplication(app, self.stream))
+
+
+def percentile(samples: list, p: float) -> float:
+    """
+    Get the *p*-th percentile (0 to 100) of samples, by nearest rank
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(max(ceil(p / 100 * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+class ReplayResult:
+    """
+    Measurements taken while replaying a trace
+
+    All times are in seconds.
+    """
+
+    def __init__(self):
+        # Time it took consume_event() to return, per event
+        self.event_latency = []
+        # Time it took to encode each frame as terminal output
+        self.render_latency = []
+        # How late each event was delivered compared to the trace
+        self.lag = []
+        self.bytes = 0
+        self.duration = 0.0
+        # Copies of all the frames, if they were kept
+        self.screen_log = None
+
+    def summary(self) -> str:
+        """
+        Get a human readable summary of the measurements
+        """
+        lines = ["{} events, {} frames, {} bytes in {:.3f}s".format(
+            len(self.event_latency), len(self.render_latency), self.bytes,
+            self.duration)]
+        for name, samples in (("consume_event", self.event_latency),
+                              ("render", self.render_latency),
+                              ("lag", self.lag)):
+            lines.append(
+                "{}: p50 {:.3f}ms p90 {:.3f}ms p99 {:.3f}ms"
+                " max {:.3f}ms".format(
+                    name, *[1000 * percentile(samples, p)
+                            for p in (50, 90, 99, 100)]))
+        return '\n'.join(lines)
+
+
+class _TimingApplication(IApplication):
+    """
+    Application that measures how long consume_event() takes
+    """
+
+    def __init__(self, app: IApplication, result: ReplayResult):
+        self.app = app
+        self.result = result
+
+    def consume_event(self, event: Event) -> TextImage:
+        start = monotonic()
+        try:
+            return self.app.consume_event(event)
+        finally:
+            self.result.event_latency.append(monotonic() - start)
+
+
+class _ReplayDisplay(TestDisplay):
+    """
+    Test display that delivers injected events on the schedule of a trace
+    """
+
+    def __init__(self, size: Size, speed: float, result: ReplayResult,
+                 keep_frames: bool):
+        super().__init__(size)
+        self.speed = speed
+        self.result = result
+        self.keep_frames = keep_frames
+        self.timestamps = deque()
+        self.encoder = OutputEncoder()
+        self._last_image = None
+        self._start = None
+
+    def schedule_event(self, timestamp: float, event: Event) -> None:
+        self.timestamps.append(timestamp)
+        self.inject_event(event)
+
+    def display_image(self, image: TextImage) -> None:
+        start = monotonic()
+        old = self._last_image
+        if old is not None and old.size != image.size:
+            old = None
+        self.result.bytes += len(self.encoder.encode(image, old))
+        if self._last_image is None:
+            self._last_image = TextImage(image.size)
+        self._last_image.copy_from(image)
+        self.result.render_latency.append(monotonic() - start)
+        if self.keep_frames:
+            super().display_image(image)
+
+    def wait_for_event(self) -> Event:
+        now = monotonic()
+        if self._start is None:
+            self._start = now
+        if self.events and self.speed:
+            due = self._start + self.timestamps.popleft() / self.speed
+            if due > now:
+                sleep(due - now)
+            self.result.lag.append(max(0.0, monotonic() - due))
+        return super().wait_for_event()
+
+
+def replay_trace(trace: list, app: IApplication, speed: float=1.0,
+                 keep_frames: bool=False) -> ReplayResult:
+    """
+    Feed a trace into an application, without a terminal
+
+    :param trace:
+        List of (timestamp, event) tuples, as returned by read_trace()
+    :param app:
+        The application to run
+    :param speed:
+        Replay speed: 1.0 replays in real time, 2.0 twice as fast and so
+        on. None replays as fast as possible.
+    :param keep_frames:
+        If True, the frames are kept in the screen_log attribute of the
+        result, like TestDisplay does
+    :returns:
+        A ReplayResult with the measurements
+
+    Frames are encoded with an OutputEncoder, as AnsiDisplay would, to
+    measure the cost of rendering them. If the trace starts with a resize
+    event, like all recorded traces do, it sets the size of the display.
+    """
+    trace = list(trace)
+    size = Size(80, 25)
+    if trace and trace[0][1].kind == EVENT_RESIZE:
+        size = trace.pop(0)[1].data
+    result = ReplayResult()
+    display = _ReplayDisplay(size, speed, result, keep_frames)
+    for timestamp, event in trace:
+        display.schedule_event(timestamp, event)
+    start = monotonic()
+    display.run(_TimingApplication(app, result))
+    result.duration = monotonic() - start
+    if keep_frames:
+        result.screen_log = display.screen_log
+    return result
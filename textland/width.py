@@ -0,0 +1,119 @@
+# This file is part of textland.
+#
+# Copyright 2014 Canonical Ltd.
+# Written by:
+#   Zygmunt Krynicki <zygmunt.krynicki@canonical.com>
+#
+# Textland is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3,
+# as published by the Free Software Foundation.
+#
+# Textland is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Textland.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Display width of characters.
+
+Most characters occupy one cell on the screen. East Asian wide and full-width
+characters (including most emoji) occupy two cells and combining characters
+occupy none. The width of ASCII characters is computed inline, everything
+else is looked up in a compact table of wide ranges once and memoized.
+"""
+
+from bisect import bisect_right
+from unicodedata import category
+
+# Marker stored in the cell to the right of a wide character. U+FFFF is a
+# noncharacter, it is never part of valid text. Images store it only where
+# put() is explicitly given it, in text it is replaced by
+# REPLACEMENT_CHARACTER.
+CONTINUATION = '\uffff'
+REPLACEMENT_CHARACTER = '\ufffd'
+
+# Inclusive ranges of wide and full-width characters, derived from
+# EastAsianWidth.txt (W and F) with unassigned code points folded in.
+_WIDE_RANGES = (
+    (0x1100, 0x115F), (0x231A, 0x231B), (0x2329, 0x232A), (0x23E9, 0x23EC),
+    (0x23F0, 0x23F0), (0x23F3, 0x23F3), (0x25FD, 0x25FE), (0x2614, 0x2615),
+    (0x2648, 0x2653), (0x267F, 0x267F), (0x2693, 0x2693), (0x26A1, 0x26A1),
+    (0x26AA, 0x26AB), (0x26BD, 0x26BE), (0x26C4, 0x26C5), (0x26CE, 0x26CE),
+    (0x26D4, 0x26D4), (0x26EA, 0x26EA), (0x26F2, 0x26F3), (0x26F5, 0x26F5),
+    (0x26FA, 0x26FA), (0x26FD, 0x26FD), (0x2705, 0x2705), (0x270A, 0x270B),
+    (0x2728, 0x2728), (0x274C, 0x274C), (0x274E, 0x274E), (0x2753, 0x2755),
+    (0x2757, 0x2757), (0x2795, 0x2797), (0x27B0, 0x27B0), (0x27BF, 0x27BF),
+    (0x2B1B, 0x2B1C), (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x2E80, 0x303E),
+    (0x3041, 0x3247), (0x3250, 0x4DBF), (0x4E00, 0xA4C6), (0xA960, 0xA97C),
+    (0xAC00, 0xD7A3), (0xF900, 0xFAD9), (0xFE10, 0xFE19), (0xFE30, 0xFE6B),
+    (0xFF01, 0xFF60), (0xFFE0, 0xFFE6), (0x16FE0, 0x1B2FB), (0x1F004, 0x1F004),
+    (0x1F0CF, 0x1F0CF), (0x1F18E, 0x1F18E), (0x1F191, 0x1F19A),
+    (0x1F200, 0x1F320), (0x1F32D, 0x1F335), (0x1F337, 0x1F37C),
+    (0x1F37E, 0x1F393), (0x1F3A0, 0x1F3CA), (0x1F3CF, 0x1F3D3),
+    (0x1F3E0, 0x1F3F0), (0x1F3F4, 0x1F3F4), (0x1F3F8, 0x1F43E),
+    (0x1F440, 0x1F440), (0x1F442, 0x1F4FC), (0x1F4FF, 0x1F53D),
+    (0x1F54B, 0x1F54E), (0x1F550, 0x1F567), (0x1F57A, 0x1F57A),
+    (0x1F595, 0x1F596), (0x1F5A4, 0x1F5A4), (0x1F5FB, 0x1F64F),
+    (0x1F680, 0x1F6C5), (0x1F6CC, 0x1F6CC), (0x1F6D0, 0x1F6D2),
+    (0x1F6D5, 0x1F6DF), (0x1F6EB, 0x1F6EC), (0x1F6F4, 0x1F6FC),
+    (0x1F7E0, 0x1F7F0), (0x1F90C, 0x1F93A), (0x1F93C, 0x1F945),
+    (0x1F947, 0x1F9FF), (0x1FA70, 0x1FAF6), (0x20000, 0x3134A),
+)
+_WIDE_STARTS = tuple(start for start, end in _WIDE_RANGES)
+_WIDE_ENDS = tuple(end for start, end in _WIDE_RANGES)
+
+# Memoized width of non-ASCII characters
+_width_cache = {}
+
+
+def _lookup_width(c: str) -> int:
+    # Combining marks and invisible format characters, except SOFT HYPHEN
+    if category(c) in ('Mn', 'Me', 'Cf') and c != '\xad':
+        return 0
+    cp = ord(c)
+    index = bisect_right(_WIDE_STARTS, cp) - 1
+    if index >= 0 and cp <= _WIDE_ENDS[index]:
+        return 2
+    return 1
+
+
+def char_width(c: str) -> int:
+    """
+    Get the number of cells (0, 1 or 2) occupied by character *c*
+    """
+    if c < '\x7f':
+        return 1
+    try:
+        return _width_cache[c]
+    except KeyError:
+        width = _width_cache[c] = _lookup_width(c)
+        return width
+
+
+def text_width(text: str) -> int:
+    """
+    Get the number of cells occupied by *text*
+    """
+    if text.isascii():
+        return len(text)
+    return sum(char_width(c) for c in text)
+
+
+def cut_to_width(text: str, width: int) -> (str, str):
+    """
+    Split *text* so that the first part occupies at most *width* cells
+
+    :returns:
+        A tuple (head, tail) such that head + tail == text
+    """
+    if text.isascii():
+        return text[:width], text[width:]
+    used = 0
+    for index, c in enumerate(text):
+        used += char_width(c)
+        if used > width:
+            return text[:index], text[index:]
+    return text, ''